@@ -0,0 +1,145 @@
+import numpy as np
+from person import Population
+
+
+class ArrayPopulation(Population):
+    """
+    A population that mirrors every person into a set of NumPy
+    columns, so that whole-population phases of the sim can be done
+    as array operations instead of loops over Person objects.
+
+    Person i (in order of creation) lives in row i of every column,
+    and person.index == i.  houseStamp records when each person joined
+    their current house, so sorting a household by it gives the same
+    order as house.occupants.  The Person objects and the livingPeople
+    list are still kept up to date, so the phases that have not been
+    vectorized work exactly as they do with a plain Population.
+    """
+    def __init__ (self, initial, startYear,
+                  minStartAge, maxStartAge):
+        self.size = 0
+        self.capacity = 0
+        self.birthdate = np.zeros(0, dtype=np.int32)
+        self.sex = np.zeros(0, dtype=np.int8)
+        self.status = np.zeros(0, dtype=np.int8)
+        self.careNeedLevel = np.zeros(0, dtype=np.int8)
+        self.house = np.zeros(0, dtype=np.int32)
+        self.partner = np.zeros(0, dtype=np.int32)
+        self.mother = np.zeros(0, dtype=np.int32)
+        self.father = np.zeros(0, dtype=np.int32)
+        self.dead = np.zeros(0, dtype=bool)
+        self.houseStamp = np.zeros(0, dtype=np.int64)
+        self.nextStamp = 0
+        self.grow(max(initial * 4, 1024))
+        Population.__init__(self, initial, startYear,
+                            minStartAge, maxStartAge)
+
+    def grow(self, capacity):
+        """Enlarge every column to hold at least this many people."""
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name, fill in [ ('birthdate', 0), ('sex', 0), ('status', 0),
+                            ('careNeedLevel', 0), ('house', -1),
+                            ('partner', -1), ('mother', -1),
+                            ('father', -1), ('dead', False),
+                            ('houseStamp', 0) ]:
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            new[self.size:] = fill
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def living(self):
+        """Indices of the living, in the same order as livingPeople."""
+        return np.flatnonzero(~self.dead[:self.size])
+
+    def loadPeople(self, people):
+        """Rebuild the columns from a list of Person objects, e.g. a pickled population."""
+        self.allPeople = []
+        self.livingPeople = []
+        self.size = 0
+        self.grow(len(people))
+        for person in people:
+            person.index = len(self.allPeople)
+            self.allPeople.append(person)
+            if person.dead == False:
+                self.livingPeople.append(person)
+        for person in people:
+            self.writeRow(person)
+        self.size = len(people)
+        ## Occupant order within each house has to come from the houses themselves
+        for person in people:
+            if person.house != None and person.dead == False:
+                self.houseStamp[person.index] = person.house.occupants.index(person)
+        self.nextStamp = max(self.nextStamp, len(people))
+        self.counters = self.recount()
+
+    def writeRow(self, person):
+        i = person.index
+        self.birthdate[i] = person.birthdate
+        self.sex[i] = person.sexCode
+        self.status[i] = person.statusCode
+        self.careNeedLevel[i] = person.careNeedLevel
+        self.house[i] = indexOf(person.house)
+        self.partner[i] = indexOf(person.partner)
+        self.mother[i] = indexOf(person.mother)
+        self.father[i] = indexOf(person.father)
+        self.dead[i] = person.dead
+        self.houseStamp[i] = self.nextStamp
+        self.nextStamp += 1
+
+    ## The hooks from Population, keeping the columns in step with the objects
+
+    def addPerson(self, person):
+        Population.addPerson(self, person)
+        self.grow(person.index + 1)
+        self.size = person.index + 1
+        self.writeRow(person)
+
+    def markDead(self, person):
+        Population.markDead(self, person)
+        self.dead[person.index] = True
+
+    def setStatus(self, person, status):
+        Population.setStatus(self, person, status)
+        self.status[person.index] = status
+
+    def setCareNeedLevel(self, person, level):
+        Population.setCareNeedLevel(self, person, level)
+        self.careNeedLevel[person.index] = level
+
+    def setPartners(self, man, woman):
+        Population.setPartners(self, man, woman)
+        self.partner[man.index] = woman.index
+        self.partner[woman.index] = man.index
+
+    def clearPartner(self, person):
+        Population.clearPartner(self, person)
+        self.partner[person.index] = -1
+
+    def setParents(self, person, mother, father):
+        Population.setParents(self, person, mother, father)
+        self.mother[person.index] = indexOf(mother)
+        self.father[person.index] = indexOf(father)
+
+    def setHouse(self, person, house):
+        Population.setHouse(self, person, house)
+        self.house[person.index] = indexOf(house)
+        self.houseStamp[person.index] = self.nextStamp
+        self.nextStamp += 1
+
+
+def indexOf(thing):
+    """Row index of a person or house, or -1 for None."""
+    if thing is None:
+        return -1
+    return thing.index
+
+
+def arrayPopulationFrom(pop):
+    """Wrap an existing object population (e.g. one loaded from file) in an ArrayPopulation."""
+    arrayPop = ArrayPopulation(0, 0, 0, 0)
+    arrayPop.loadPeople(pop.allPeople)
+    return arrayPop
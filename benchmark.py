@@ -0,0 +1,460 @@
+"""
+Benchmarks for the simulation.
+
+    python benchmark.py phases [--sizes 1000,10000,100000,1000000]
+                               [--engine array] [--years 2]
+                               [--save FILE] [--compare FILE]
+
+builds a synthetic population of each size, times every phase of a
+year on it, and reports the cost per living agent and how each phase
+scales with population size (the exponent k in time ~ N^k, so anything
+near 2 is quadratic). --save writes the results as a JSON baseline;
+--compare checks them against one and flags any phase that has got
+slower per agent, or scales worse than it did, wherever the timings are
+long enough to tell.
+
+The object engine's deaths phase is currently quadratic, so at the
+larger sizes it is best benchmarked with --engine array, or with a
+shorter --sizes list. benchmark-phases.json is the baseline for the
+array engine at the default sizes. With --compare, the engine defaults
+to the baseline's, and a baseline for another engine or number of
+years is refused.
+
+    python benchmark.py sweep [--rows 0:2] [--pops 250,500,750]
+                              [--workers 1] [--seed 1] [--end-year Y]
+                              [--save FILE] [--compare FILE]
+
+runs the given rows of lptau10-1600runsfull.txt through maintest's
+batch path (run_ensemble, as the -t option does), headless, with no
+result cache or results store and a fixed master seed, once for each
+initialPop. Each initialPop is run in a process of its own so that its
+peak resident memory can be measured, and the wall time, peak RSS,
+runs per hour and seconds per simulated year are reported for each.
+The mean tax burden is kept too: with the same seed and rows it only
+changes if the model does. benchmark-sweep.json is the baseline for
+the defaults.
+
+Both baselines describe the tree as it was when they were last saved,
+on the machine that saved them. Save them again (--save) after any
+change that makes the model faster, and on a new machine, or the
+comparison will miss regressions smaller than the speed-up.
+"""
+
+import argparse
+import gc
+import json
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+import numpy as np
+
+import maintest
+from sim import Sim
+from house import Map
+from person import Person
+from person import Population
+from person import CHILD, AT_HOME, INDEPENDENT, RETIRED
+from arraypop import ArrayPopulation
+from seeds import seedGenerators
+
+
+## Exponents at or above this are reported as quadratic
+quadratic = 1.8
+
+## Phases are only compared with the baseline at sizes where they take at
+## least this many seconds (for scaling, at the larger size of the pair);
+## shorter times are too noisy to judge
+measurable = 0.05
+
+## The phases of a year, in the order doOneYear runs them
+def doPyramid(sim):
+    sim.pyramid.update(sim.pyramidColumns, sim.p['pixelsInPopPyramid'])
+    sim.pyramid.maleData        ## make it do the tally it would otherwise put off
+
+phases = [ ('deaths', lambda sim: sim.doDeaths()),
+           ('care', lambda sim: sim.doCareTransitions()),
+           ('age', lambda sim: sim.doAgeTransitions()),
+           ('births', lambda sim: sim.doBirths()),
+           ('divorces', lambda sim: sim.doDivorces()),
+           ('marriages', lambda sim: sim.doMarriages()),
+           ('moving', lambda sim: sim.doMovingAround()),
+           ('pyramid', doPyramid),
+           ('stats', lambda sim: sim.doStats()) ]
+
+
+#######################################################
+## Synthetic populations
+
+def benchmarkParams(engine):
+    """The batch runs' parameters, headless, for the given engine."""
+    p = dict(maintest.p)
+    p['engine'] = engine
+    p['interactiveGraphics'] = False
+    p['singleRunGraphs'] = False
+    p['verboseDebugging'] = False
+    p['checkpointEvery'] = 0
+    p['instrumentReport'] = None
+    return p
+
+
+def syntheticSim(params, living, year = 2000, seed = '1'):
+    """
+    A Sim part-way through the year before the given one, with about
+    this many living people: couples of all adult ages (some widowed),
+    many with children at home, retired or in need of care as their age
+    suggests, one household to a house. The towns are made bigger
+    until there are twice as many houses as households. Both random
+    number generators are seeded from the seed key given, before the
+    map and the people are made.
+    """
+    p = dict(params)
+    households = living / 2.5
+    densities = sum([ d * p['mapDensityModifier'] for row in p['ukMap'] for d in row if d > 0.0 ])
+    grid = int(math.ceil(math.sqrt(2.0 * households / densities)))
+    p['townGridDimension'] = max(p['townGridDimension'], grid)
+
+    sim = Sim(p)
+    sim.seed = seed
+    sim.rng = seedGenerators(seed)
+    sim.map = Map(p['mapGridXDimension'], p['mapGridYDimension'],
+                  p['townGridDimension'], p['cdfHouseClasses'],
+                  p['ukMap'], p['ukClassBias'], p['mapDensityModifier'])
+    if p['engine'] == 'array':
+        pop = ArrayPopulation(0, year, 0, 0)
+    else:
+        pop = Population(0, year, 0, 0)
+    sim.pop = pop
+
+    houses = list(sim.map.allHouses)
+    random.shuffle(houses)
+    year = year - 1
+
+    def newPerson(mother, father, age, sex, house):
+        person = Person(mother, father, year - age, sex, house, house.size)
+        pop.addPerson(person)
+        pop.setHouse(person, house)
+        house.occupants.append(person)
+        if age < p['ageOfAdulthood']:
+            status = CHILD
+        elif mother != None:
+            status = AT_HOME
+        elif age < p['ageOfRetirement']:
+            status = INDEPENDENT
+        else:
+            status = RETIRED
+        pop.setStatus(person, status)
+        if age > 50 and random.random() < (age - 50) / 60.0:
+            pop.setCareNeedLevel(person, random.randint(1, p['numCareLevels'] - 1))
+        return person
+
+    while pop.counters.living < living:
+        house = houses.pop()
+        age = random.randint(20, 90)
+        woman = newPerson(None, None, age, 'female', house)
+        if random.random() < 0.15:
+            ## widowed, children long gone
+            sim.map.houseOccupied(house)
+            continue
+        man = newPerson(None, None, age + random.randint(-3, 5), 'male', house)
+        pop.setPartners(man, woman)
+        if age < 60:
+            for i in range(random.randint(0, 3)):
+                child = newPerson(woman, man, random.randint(0, min(age - 18, 24)), 'random', house)
+                woman.children.append(child)
+                man.children.append(child)
+        sim.map.houseOccupied(house)
+
+    sim.displayHouse = pop.allPeople[0].house
+    sim.nextDisplayHouse = None
+    sim.loadTables()
+    sim.year = year
+    sim.nextYear = year + 1
+    return sim
+
+
+#######################################################
+## Phase benchmarks
+
+def timePhases(sim, years):
+    """Seconds taken by each phase in each of the next few years, and the living at the start of each."""
+    seconds = dict([ (name, []) for name, phase in phases ])
+    agents = []
+    for i in range(years):
+        sim.year = sim.nextYear
+        sim.nextYear += 1
+        agents.append(sim.pop.counters.living)
+        for name, phase in phases:
+            start = time.time()
+            phase(sim)
+            seconds[name].append(time.time() - start)
+    return seconds, agents
+
+
+def exponent(sizes, seconds):
+    """The k in seconds ~ sizes^k, by least squares on the logs."""
+    if len(sizes) < 2:
+        return None
+    logs = [ math.log(max(s, 1e-9)) for s in seconds ]
+    return float(np.polyfit([ math.log(n) for n in sizes ], logs, 1)[0])
+
+
+def benchmarkPhases(sizes, engine, years):
+    params = benchmarkParams(engine)
+    results = { 'engine': engine, 'years': years, 'sizes': sizes, 'agents': [],
+                'python': platform.python_version(), 'numpy': np.__version__,
+                'phases': dict([ (name, { 'seconds': [], 'perAgent': [] }) for name, phase in phases ]) }
+    for size in sizes:
+        start = time.time()
+        sim = syntheticSim(params, size, seed = str(size))
+        print "Built", sim.pop.counters.living, "people in", round(time.time() - start, 2), "s"
+        seconds, agents = timePhases(sim, years)
+        living = float(np.mean(agents))
+        results['agents'].append(living)
+        for name, phase in phases:
+            best = float(np.median(seconds[name]))
+            results['phases'][name]['seconds'].append(best)
+            results['phases'][name]['perAgent'].append(best / living)
+        ## Clear away this size's people before building the next
+        del sim
+        gc.collect()
+
+    ## The exponent overall, and between each size and the next
+    agents = results['agents']
+    for name, phase in phases:
+        entry = results['phases'][name]
+        entry['exponent'] = exponent(agents, entry['seconds'])
+        entry['exponents'] = [ exponent(agents[i:i+2], entry['seconds'][i:i+2])
+                               for i in range(len(agents) - 1) ]
+    return results
+
+
+def showPhases(results):
+    print
+    print "Engine:", results['engine'], " median of", results['years'], "years"
+    header = "%-10s" % 'phase'
+    for n in results['agents']:
+        header += "%16s" % ("us/agent@%d" % n)
+    print header + "%10s" % 'exponent'
+    for name, phase in phases:
+        entry = results['phases'][name]
+        line = "%-10s" % name
+        for cost in entry['perAgent']:
+            line += "%16.3f" % (cost * 1e6)
+        if entry['exponent'] is None:
+            line += "%10s" % '-'
+        else:
+            line += "%10.2f" % entry['exponent']
+            if entry['exponent'] >= quadratic:
+                line += "  quadratic"
+        print line
+
+
+def comparePhases(results, baseline, tolerance):
+    """Print and return the phases that got slower per agent or scale worse than the baseline."""
+    ## Timings from another engine or number of years say nothing about regressions
+    for key in [ 'engine', 'years' ]:
+        if results[key] != baseline[key]:
+            print
+            print "Can't compare: the baseline has", key, baseline[key], "but this run had", results[key]
+            return [ key + " differs from the baseline's" ]
+    flagged = []
+    for name, phase in phases:
+        if name not in baseline['phases']:
+            continue
+        now = results['phases'][name]
+        then = baseline['phases'][name]
+        for i in range(len(results['sizes'])):
+            if results['sizes'][i] in baseline['sizes'] and now['seconds'][i] >= measurable:
+                j = baseline['sizes'].index(results['sizes'][i])
+                ratio = now['perAgent'][i] / max(then['perAgent'][j], 1e-12)
+                if ratio > 1.0 + tolerance:
+                    flagged.append("%s at %d: %.2fx slower per agent" % (name, results['sizes'][i], ratio))
+        ## Scaling is compared between the same pairs of sizes, and
+        ## only where the larger size takes long enough to time well:
+        ## it counts against a phase if it scales worse and also costs
+        ## more per agent at the larger size, or has become quadratic
+        pairs = zip(baseline['sizes'], baseline['sizes'][1:])
+        for i in range(len(now['exponents'])):
+            pair = (results['sizes'][i], results['sizes'][i+1])
+            if pair not in pairs or now['seconds'][i+1] < measurable:
+                continue
+            j = pairs.index(pair)
+            was = then['exponents'][j]
+            rose = now['perAgent'][i+1] > then['perAgent'][j+1] * (1.0 + tolerance)
+            if now['exponents'][i] > was + 0.2 and rose:
+                flagged.append("%s from %d to %d: scales as N^%.2f, was N^%.2f"
+                               % (name, pair[0], pair[1], now['exponents'][i], was))
+            if now['exponents'][i] >= quadratic and was < quadratic:
+                flagged.append("%s from %d to %d: now scales quadratically (N^%.2f)"
+                               % (name, pair[0], pair[1], now['exponents'][i]))
+    print
+    if len(flagged) == 0:
+        print "No regressions against the baseline."
+    for problem in flagged:
+        print "REGRESSION:", problem
+    return flagged
+
+
+#######################################################
+## Sweep benchmarks
+
+def sweepDesign(rows):
+    """The design points for a slice (like '0:2') of the rows of the 10-parameter LPtau design."""
+    first, last = [ int(x) for x in rows.split(':') ]
+    sim_array = np.genfromtxt('lptau10-1600runsfull.txt', delimiter='\t')
+    return maintest.designFromList(maintest.tenParamsDesignParams, list(sim_array[first:last].T))
+
+
+def peakRSS():
+    """The most memory in use at once by this process or any of its finished children, in MB."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024.0
+
+
+def timeSweep(connection, design, initialPop, engine, workers, seed, endYear):
+    """Run the design at one initialPop and send back its measurements. Runs in a process of its own."""
+    base = benchmarkParams(engine)
+    base['initialPop'] = initialPop
+    base['resultCache'] = None
+    base['resultsStore'] = None
+    if endYear is not None:
+        base['endYear'] = endYear
+    start = time.time()
+    results = maintest.run_ensemble(design, 1, workers, base, seed)
+    seconds = time.time() - start
+    runs = len(design)
+    years = base['endYear'] - base['startYear'] + 1
+    taxes = [ tax for point in results for tax, key in point ]
+    connection.send({ 'initialPop': initialPop, 'runs': runs, 'years': years,
+                      'seconds': seconds, 'peakRSS': peakRSS(),
+                      'runsPerHour': runs * 3600.0 / seconds,
+                      'secondsPerYear': seconds / (runs * years),
+                      'meanTax': float(np.mean(taxes)) })
+    connection.close()
+
+
+def benchmarkSweep(rows, pops, engine, workers, seed, endYear):
+    design = sweepDesign(rows)
+    results = { 'rows': rows, 'engine': engine, 'workers': workers, 'seed': seed,
+                'endYear': endYear, 'pops': pops, 'runs': [],
+                'python': platform.python_version(), 'numpy': np.__version__ }
+    for initialPop in pops:
+        receiver, sender = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(target = timeSweep,
+            args = (sender, design, initialPop, engine, workers, seed, endYear))
+        process.start()
+        results['runs'].append(receiver.recv())
+        process.join()
+    return results
+
+
+def showSweep(results):
+    print
+    print "Rows", results['rows'], "of the LPtau design, engine:", results['engine'],
+    print " workers:", results['workers'], " master seed:", results['seed']
+    print "%10s%6s%12s%12s%12s%14s%14s" % ('initialPop', 'runs', 'seconds', 'peak MB',
+                                           'runs/hour', 'ms/year', 'mean tax')
+    for run in results['runs']:
+        print "%10d%6d%12.1f%12.1f%12.1f%14.2f%14.2f" % (run['initialPop'], run['runs'],
+            run['seconds'], run['peakRSS'], run['runsPerHour'],
+            run['secondsPerYear'] * 1000.0, run['meanTax'])
+
+
+def compareSweep(results, baseline, tolerance):
+    """Print and return the initialPops whose throughput or memory got worse than the baseline's."""
+    flagged = []
+    for key in [ 'rows', 'engine', 'workers', 'seed', 'endYear' ]:
+        if results[key] != baseline[key]:
+            print "Warning: baseline has", key, baseline[key], "but this run had", results[key]
+    then = dict([ (run['initialPop'], run) for run in baseline['runs'] ])
+    for run in results['runs']:
+        if run['initialPop'] not in then:
+            continue
+        was = then[run['initialPop']]
+        if run['runsPerHour'] < was['runsPerHour'] / (1.0 + tolerance):
+            flagged.append("initialPop %d: %.1f runs/hour, was %.1f"
+                           % (run['initialPop'], run['runsPerHour'], was['runsPerHour']))
+        if run['peakRSS'] > was['peakRSS'] * (1.0 + tolerance):
+            flagged.append("initialPop %d: peak RSS %.1f MB, was %.1f MB"
+                           % (run['initialPop'], run['peakRSS'], was['peakRSS']))
+        if run['meanTax'] != was['meanTax']:
+            print "Note: initialPop", run['initialPop'], "mean tax", run['meanTax'],
+            print "differs from the baseline's", was['meanTax'], "so the model's results have changed"
+    print
+    if len(flagged) == 0:
+        print "No regressions against the baseline."
+    for problem in flagged:
+        print "REGRESSION:", problem
+    return flagged
+
+
+#######################################################
+## Command line
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the social care sim.')
+    parser.add_argument('suite', choices=['phases', 'sweep'],
+        help='which benchmark to run.')
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+        help='comma-separated population sizes for the phase benchmark.')
+    parser.add_argument('--years', type=int, default=2,
+        help='years to time at each size (the median is kept).')
+    parser.add_argument('--rows', default='0:2',
+        help='slice of the rows of lptau10-1600runsfull.txt for the sweep benchmark.')
+    parser.add_argument('--pops', default='250,500,750',
+        help='comma-separated initialPop values for the sweep benchmark.')
+    parser.add_argument('--workers', type=int, default=1,
+        help='worker processes for the sweep benchmark.')
+    parser.add_argument('--seed', default='1',
+        help='master seed for the sweep benchmark.')
+    parser.add_argument('--end-year', type=int, default=None,
+        help='end year for the sweep benchmark runs (default: endYear from the parameters).')
+    parser.add_argument('--engine', default=None, choices=['object', 'array'],
+        help='population engine to benchmark (default: the --compare baseline\'s, '
+             'or array for phases and object for sweep).')
+    parser.add_argument('--save', metavar='FILE',
+        help='write the results to FILE as a JSON baseline.')
+    parser.add_argument('--compare', metavar='FILE',
+        help='flag regressions against the JSON baseline in FILE.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+        help='how much worse than the baseline counts as a regression (0.25 = 25%%).')
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline = json.load(open(args.compare))
+        if args.engine is None:
+            args.engine = baseline['engine']
+    if args.engine is None:
+        if args.suite == 'phases':
+            args.engine = 'array'
+        else:
+            args.engine = 'object'
+
+    if args.suite == 'phases':
+        sizes = [ int(x) for x in args.sizes.split(',') ]
+        results = benchmarkPhases(sizes, args.engine, args.years)
+        showPhases(results)
+        compare = comparePhases
+    else:
+        pops = [ int(x) for x in args.pops.split(',') ]
+        results = benchmarkSweep(args.rows, pops, args.engine, args.workers,
+                                 args.seed, args.end_year)
+        showSweep(results)
+        compare = compareSweep
+
+    if args.save:
+        outFile = open(args.save, 'w')
+        json.dump(results, outFile, indent = 1, sort_keys = True)
+        outFile.close()
+    if args.compare:
+        if len(compare(results, baseline, args.tolerance)) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
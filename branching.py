@@ -0,0 +1,126 @@
+"""
+Runs that share their burn-in.
+
+Some parameters only make a difference from p['thePresent'] on:
+doDivorces switches to variableDivorce then, and doMovingAround to
+variableMoveBack. Every run of a sweep over them, with the same seed,
+is identical up to the end of the year before, so that part only needs
+simulating once. runBranches does it once, then forks a copy of the
+process for each variant to finish the run from there. Copy-on-write
+means the burnt-in Sim is shared rather than copied, and each branch
+gives exactly the result of a full run with the same parameters and
+seed key.
+"""
+
+import os
+import pickle
+import sys
+import traceback
+from sim import Sim
+from results import runSeries
+
+
+## The parameters a branch may change: nothing before p['thePresent'] uses them
+postPresentParams = [ 'variableDivorce', 'variableMoveBack' ]
+
+
+def branchParams(params, variant):
+    """The parameters for one branch: the shared ones with the variant's changes."""
+    branch = dict(params)
+    branch.update(variant)
+    branch['singleRunGraphs'] = False
+    branch['interactiveGraphics'] = False
+    branch['checkpointEvery'] = 0
+    return branch
+
+
+def runBranches(params, variants, seed, workers = 1, keepSeries = False):
+    """
+    Run one simulation per variant, a dict of changes to the
+    postPresentParams, all with the given seed key and sharing one
+    burn-in to the end of the year before p['thePresent']. Up to
+    workers branches run at once. Returns (tax, seed) for each variant,
+    in order, or with keepSeries ((tax, seed), series) with the run's
+    yearly series as from results.runSeries.
+    """
+    for variant in variants:
+        for name in variant:
+            if name not in postPresentParams:
+                print "Can't branch on", name, "- it is used before the present."
+                sys.exit()
+
+    if not hasattr(os, 'fork'):
+        ## No fork here (e.g. Windows), so every branch has to be run in full
+        results = []
+        for variant in variants:
+            sim = Sim(branchParams(params, variant))
+            result = sim.run(seed)
+            if keepSeries:
+                result = (result, runSeries(sim))
+            results.append(result)
+        return results
+
+    sim = Sim(branchParams(params, {}))
+    sim.start(seed)
+    sim.runUntil(params['thePresent'] - 1)
+
+    results = [ None ] * len(variants)
+    running = []
+    for i in range(len(variants)):
+        if len(running) >= workers:
+            collectBranch(running, results)
+        readEnd, writeEnd = os.pipe()
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            ## The branch: finish the run with the variant's parameters,
+            ## send the result back, and leave without any of the
+            ## parent's clean-up
+            os.close(readEnd)
+            status = 0
+            try:
+                sim.p = branchParams(params, variants[i])
+                sim.runUntil(sim.p['endYear'])
+                result = sim.finish()
+                if keepSeries:
+                    result = (result, runSeries(sim))
+                writeAll(writeEnd, pickle.dumps(result, 2))
+            except:
+                traceback.print_exc()
+                status = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+        os.close(writeEnd)
+        running.append((pid, i, readEnd))
+
+    while len(running) > 0:
+        collectBranch(running, results)
+    return results
+
+
+def collectBranch(running, results):
+    """Wait for the oldest running branch to finish and file its result."""
+    pid, i, readEnd = running.pop(0)
+    data = readAll(readEnd)
+    pid, status = os.waitpid(pid, 0)
+    if status != 0 or len(data) == 0:
+        print "Branch", i, "failed."
+        sys.exit()
+    results[i] = pickle.loads(data)
+
+
+def writeAll(fd, data):
+    while len(data) > 0:
+        data = data[os.write(fd, data):]
+    os.close(fd)
+
+
+def readAll(fd):
+    chunks = []
+    chunk = os.read(fd, 65536)
+    while len(chunk) > 0:
+        chunks.append(chunk)
+        chunk = os.read(fd, 65536)
+    os.close(fd)
+    return b''.join(chunks)
@@ -0,0 +1,102 @@
+"""
+An on-disk cache of finished runs, so that a sweep can skip any run it
+has already done: points shared with an earlier design, or everything
+before the point where an interrupted sweep stopped.
+
+Each run is stored under a key hashed from its model parameters, its
+seed key (see seeds.py) and the simulator version, which is itself a
+hash of the model's source files and the tables it reads. Changing any
+of those gives new keys, so stale results are never picked up.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+
+## Everything the results of a run depend on besides its parameters and seed
+modelFiles = [ 'sim.py', 'person.py', 'house.py', 'arraypop.py', 'seeds.py',
+               'babyrate.txt.csv', 'deathrate.fem.csv', 'deathrate.male.csv' ]
+
+
+def simulatorVersion():
+    """A hash of the model's source files and input tables."""
+    digest = hashlib.sha256()
+    for name in modelFiles:
+        digest.update(name.encode('ascii'))
+        digest.update(open(name, 'rb').read())
+    return digest.hexdigest()
+
+
+def canonical(value):
+    """A plain, consistently ordered version of a parameter value, for hashing."""
+    if isinstance(value, dict):
+        return [ [ str(k), canonical(value[k]) ] for k in sorted(value) ]
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [ canonical(x) for x in value ]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return repr(value)
+    return value
+
+
+## Parameters that say how a run is carried out, recorded or shown but
+## not what it does, which are left out of paramHash: the batch run
+## settings (the master seed is already part of each run's seed key),
+## the lists of values a sweep steps through, and the display details
+bookkeepingParams = [ 'favouriteSeed', 'resultCache', 'resultsStore', 'instrumentReport',
+                      'checkpointEvery', 'checkpointFile', 'verboseDebugging',
+                      'interactiveGraphics', 'singleRunGraphs', 'numRepeats',
+                      'ageingParentList', 'careProbList', 'retiredHoursList', 'retiredAgeList',
+                      'delayTime', 'screenWidth', 'screenHeight', 'bgColour', 'mainFont',
+                      'fontColour', 'dateX', 'dateY', 'popX', 'popY', 'pixelsInPopPyramid',
+                      'careLevelColour', 'houseSizeColour', 'pixelsPerTown',
+                      'maxTextUpdateList', 'careLevelNames' ]
+
+
+def paramHash(params):
+    """
+    A hash of the model parameters in a parameter set, the same
+    whatever order it was built in and whatever its bookkeeping
+    parameters are.
+    """
+    model = dict([ (k, v) for k, v in params.items() if k not in bookkeepingParams ])
+    text = json.dumps(canonical(model))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """A directory of finished runs, one small JSON file per run."""
+    def __init__ (self, directory = 'runcache'):
+        self.directory = directory
+        self.version = simulatorVersion()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, params, seed):
+        text = json.dumps([ paramHash(params), seed, self.version ])
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        """The stored result for a key, or None if the run hasn't been done."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        return json.load(open(path))
+
+    def put(self, key, result):
+        ## Write to a temporary file and rename it into place, so that a
+        ## sweep interrupted mid-write never leaves half a result behind
+        path = self.path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        temporary = path + '.tmp'
+        outFile = open(temporary, 'w')
+        json.dump(result, outFile)
+        outFile.close()
+        os.rename(temporary, path)
@@ -1,8 +1,27 @@
 
 import random
+import numpy as np
 
-class House:
+class Slotted(object):
+    """
+    A base for the classes there are many of, which keep their fields
+    in __slots__ rather than a dict of their own to save memory.
+    getstate and setstate give a dict of the fields, for pickling and
+    checkpoints.
+    """
+    __slots__ = ()
+
+    def __getstate__ (self):
+        return dict([ (name, getattr(self, name)) for name in self.__slots__
+                      if hasattr(self, name) ])
+
+    def __setstate__ (self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+class House(Slotted):
     """The house class stores information about a distinct house in the sim."""
+    __slots__ = [ 'size', 'occupants', 'town', 'x', 'y', 'icon', 'index', 'name' ]
     def __init__ (self, town, cdfHouseClasses, classBias, hx, hy):
         r = random.random()
         i = 0
@@ -17,14 +36,17 @@ class House:
         self.x = hx
         self.y = hy
         self.icon = None
+        self.index = None
         self.name = self.town.name + "-" + str(hx) + "-" + str(hy)
                             
-class Town:
+class Town(Slotted):
     """Contains a collection of houses."""
+    __slots__ = [ 'x', 'y', 'index', 'houses', 'name' ]
     def __init__ (self, townGridDimension, tx, ty,
                   cdfHouseClasses, density, classBias, densityModifier ):
         self.x = tx
         self.y = ty
+        self.index = None
         self.houses = []
         self.name = str(tx) + "-" + str(ty)
         if density > 0.0:
@@ -36,6 +58,35 @@ class Town:
                                          classBias,hx,hy)
                         self.houses.append(newHouse)
 
+class HouseIndex:
+    """A set of houses with O(1) insertion, removal and random choice."""
+    def __init__ (self):
+        self.houses = []
+        self.position = {}
+
+    def __len__ (self):
+        return len(self.houses)
+
+    def __iter__ (self):
+        return iter(self.houses)
+
+    def __contains__ (self, house):
+        return house in self.position
+
+    def add(self, house):
+        if house not in self.position:
+            self.position[house] = len(self.houses)
+            self.houses.append(house)
+
+    def discard(self, house):
+        i = self.position.pop(house, None)
+        if i is not None:
+            ## Fill the gap with the last house rather than shuffling the list down
+            last = self.houses.pop()
+            if last is not house:
+                self.houses[i] = last
+                self.position[last] = i
+
 class Map:
     """Contains a collection of towns to make up the whole country being simulated."""
     def __init__ (self, gridXDimension, gridYDimension,
@@ -43,15 +94,74 @@ class Map:
                   ukMap, ukClassBias, densityModifier ):
         self.towns = []
         self.allHouses = []
-        self.occupiedHouses = []
+        self.occupiedHouses = HouseIndex()
 
         for y in range(gridYDimension):
             for x in range(gridXDimension):
                 newTown = Town(townGridDimension, x, y,
                                cdfHouseClasses, ukMap[y][x],
                                ukClassBias[y][x], densityModifier )
+                newTown.index = len(self.towns)
                 self.towns.append(newTown)
 
+        ## The town grid is fixed from here on, so work out once which
+        ## towns neighbour each other and how far apart they all are
+        townX = np.array([ t.x for t in self.towns ])
+        townY = np.array([ t.y for t in self.towns ])
+        xDist = np.abs(townX[:, None] - townX[None, :])
+        yDist = np.abs(townY[:, None] - townY[None, :])
+        self.townDistance = (xDist + yDist).astype(np.int32)
+        self.neighbours = [ [ self.towns[k] for k in np.flatnonzero((xDist[i] <= 1) & (yDist[i] <= 1)) ]
+                            for i in range(len(self.towns)) ]
+
         for t in self.towns:
             for h in t.houses:
+                h.index = len(self.allHouses)
                 self.allHouses.append(h)
+        self.houseTown = np.array([ h.town.index for h in self.allHouses ], dtype=np.int32)
+
+        ## Empty houses, indexed by (town, size) and by size alone, and
+        ## the occupied ones, all kept up to date as houses fill and empty
+        self.emptyHouses = {}
+        self.emptyHousesOfSize = {}
+        for h in self.allHouses:
+            self.houseVacated(h)
+
+    def houseOccupied(self, house):
+        """Note that somebody has moved into a house, which may have been empty."""
+        self.occupiedHouses.add(house)
+        key = (house.town, house.size)
+        if key in self.emptyHouses:
+            self.emptyHouses[key].discard(house)
+            self.emptyHousesOfSize[house.size].discard(house)
+
+    def houseVacated(self, house):
+        """Note that the last occupant has left a house."""
+        self.occupiedHouses.discard(house)
+        key = (house.town, house.size)
+        if key not in self.emptyHouses:
+            self.emptyHouses[key] = HouseIndex()
+        if house.size not in self.emptyHousesOfSize:
+            self.emptyHousesOfSize[house.size] = HouseIndex()
+        self.emptyHouses[key].add(house)
+        self.emptyHousesOfSize[house.size].add(house)
+
+    def randomEmptyHouse(self, size, towns=None):
+        """
+        Choose uniformly among the empty houses of the given size,
+        either anywhere or only in the given towns. Returns None if
+        there are no such houses.
+        """
+        if towns is None:
+            candidates = [ self.emptyHousesOfSize.get(size) ]
+        else:
+            candidates = [ self.emptyHouses.get((t, size)) for t in towns ]
+        candidates = [ c for c in candidates if c ]
+        total = sum([ len(c) for c in candidates ])
+        if total == 0:
+            return None
+        r = int(random.random() * total)
+        for c in candidates:
+            if r < len(c):
+                return c.houses[r]
+            r -= len(c)
@@ -0,0 +1,73 @@
+"""
+Lightweight instrumentation of a run: the wall time spent in each phase
+of each year, and counts of the work done, such as moves made, how far
+house searches had to go, marriage candidates looked at and care donors
+tried. Cheap enough to leave on for a large-population run, and written
+out at the end as a JSON or CSV report.
+"""
+
+import json
+import time
+
+
+## The phases of doOneYear, in the order they run
+phaseNames = [ 'deaths', 'care', 'age', 'births', 'divorces', 'marriages',
+               'moving', 'pyramid', 'stats' ]
+
+
+class Instruments:
+    """Per-year phase timings and work counts, kept only if enabled."""
+    def __init__ (self, enabled):
+        self.enabled = enabled
+        self.years = []
+        self.current = None
+
+    def startYear(self, year):
+        if self.enabled:
+            self.current = { 'year': year, 'seconds': {}, 'counts': {} }
+            self.years.append(self.current)
+
+    def phase(self, name, function):
+        """Call function, timing it as the named phase of the current year."""
+        if not self.enabled:
+            function()
+            return
+        start = time.time()
+        function()
+        seconds = self.current['seconds']
+        seconds[name] = seconds.get(name, 0.0) + time.time() - start
+
+    def count(self, name, n = 1):
+        if self.enabled:
+            counts = self.current['counts']
+            counts[name] = counts.get(name, 0) + n
+
+    def totals(self):
+        """Seconds per phase and counts, summed over every year."""
+        seconds = {}
+        counts = {}
+        for year in self.years:
+            for name, value in year['seconds'].items():
+                seconds[name] = seconds.get(name, 0.0) + value
+            for name, value in year['counts'].items():
+                counts[name] = counts.get(name, 0) + value
+        return { 'seconds': seconds, 'counts': counts }
+
+    def write(self, path):
+        """Write the report, as CSV (one row per year) if path ends in .csv, otherwise JSON."""
+        if path.endswith('.csv'):
+            countNames = sorted(set([ name for year in self.years for name in year['counts'] ]))
+            outFile = open(path, 'w')
+            outFile.write(','.join([ 'year' ] + [ name + 'Seconds' for name in phaseNames ]
+                                   + countNames) + '\n')
+            for year in self.years:
+                row = [ str(year['year']) ]
+                row += [ repr(year['seconds'].get(name, 0.0)) for name in phaseNames ]
+                row += [ str(year['counts'].get(name, 0)) for name in countNames ]
+                outFile.write(','.join(row) + '\n')
+            outFile.close()
+        else:
+            outFile = open(path, 'w')
+            json.dump({ 'phases': phaseNames, 'years': self.years,
+                        'totals': self.totals() }, outFile, indent = 1)
+            outFile.close()
@@ -116,7 +116,7 @@ class Sim:
             for man in men:
                 man.house = random.choice(remainingHouses)
                 man.sec = man.house.size  ## This may not always work, assumes house classes = SEC classes!
-                self.map.occupiedHouses.append(man.house)            
+                self.map.houseOccupied(man.house)
                 remainingHouses.remove(man.house)
                 woman = man.partner
                 woman.house = man.house
@@ -171,7 +171,7 @@ class Sim:
                 self.pop.livingPeople.remove(person)
                 person.house.occupants.remove(person)
                 if len(person.house.occupants) == 0:
-                    self.map.occupiedHouses.remove(person.house)
+                    self.map.houseVacated(person.house)
                     if (self.p['interactiveGraphics']):
                         self.canvas.itemconfig(person.house.icon, state='hidden')
 
@@ -569,7 +569,7 @@ class Sim:
             oldHouse = i.house
             oldHouse.occupants.remove(i)
             if len(oldHouse.occupants) ==  0:
-                self.map.occupiedHouses.remove(oldHouse)
+                self.map.houseVacated(oldHouse)
                 if (self.p['interactiveGraphics']):
                     self.canvas.itemconfig(oldHouse.icon, state='hidden')
 
@@ -577,12 +577,9 @@ class Sim:
             i.house = newHouse
             i.movedThisYear = True
 
-        ## This next is sloppy and will lead to loads of duplicates in the
-        ## occupiedHouses list, but we don't want to miss any -- that's
-        ## much worse -- and the problem will be solved by a conversion
-        ## to set and back to list int he stats method in a moment
-
-        self.map.occupiedHouses.append(newHouse)
+        ## The map's occupied houses are a set, so adding a house that is
+        ## already occupied does no harm
+        self.map.houseOccupied(newHouse)
         if (self.p['interactiveGraphics']):
             self.canvas.itemconfig(newHouse.icon, state='normal')
             
@@ -609,13 +606,10 @@ class Sim:
         currentPop = len(self.pop.livingPeople)
         self.pops.append(currentPop)
 
-        ## Check for double-included houses by converting to a set and back again
-        self.map.occupiedHouses = list(set(self.map.occupiedHouses))
-
         ## Check for overlooked empty houses
         emptyHouses = [x for x in self.map.occupiedHouses if len(x.occupants) == 0]
         for h in emptyHouses:
-            self.map.occupiedHouses.remove(h)
+            self.map.houseVacated(h)
             if (self.p['interactiveGraphics']):
                 self.canvas.itemconfig(h.icon, state='hidden')
 
@@ -2,9 +2,7 @@
 from sim import Sim
 import os
 import cProfile
-import pylab
 import math
-import matplotlib.pyplot as plt
 
 
 def init_params():
@@ -24,6 +22,12 @@ def init_params():
     p['favouriteSeed'] = None
     p['numRepeats'] = 1
     p['loadFromFile'] = False
+    p['engine'] = 'object'      ## 'object' for Person objects, 'array' for the NumPy column store
+    p['resultCache'] = 'runcache'   ## where batch runs are cached; None to always rerun
+    p['resultsStore'] = 'results.sqlite'    ## where batch runs' yearly series are kept; None for nowhere
+    p['checkpointEvery'] = 0    ## years between checkpoints; 0 for none
+    p['checkpointFile'] = 'checkpoint.gz'
+    p['instrumentReport'] = None    ## file for per-phase timings and work counts (.json or .csv; {seed} is replaced by the seed key); None for none
 
     ## Mortality statistics
     p['baseDieProb'] = 0.0001
@@ -32,6 +36,8 @@ def init_params():
     p['maleAgeDieProb'] = 0.00021
     p['femaleAgeScaling'] = 15.5
     p['femaleAgeDieProb'] = 0.00019
+    p['preEmpiricalMortality'] = False     ## apply the made-up hazard above before 1951
+    p['deathSkipsNextPerson'] = True    ## nobody straight after a death gets a chance to die that year, as in the calibrated runs
     p['num5YearAgeClasses'] = 28
 
     ## Transitions to care statistics
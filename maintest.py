@@ -1,13 +1,19 @@
 
 from sim import Sim
+from seeds import seedKey
+from seeds import newMasterSeed
+from cache import ResultCache
+from cache import paramHash
+from branching import runBranches
+from results import ResultsStore
+from results import runSeries
 import os
 import cProfile
-import pylab
 import math
-import matplotlib.pyplot as plt
 import argparse
 import json
 import decimal
+import multiprocessing
 import numpy as np
 
 
@@ -28,6 +34,12 @@ def init_params():
     p['favouriteSeed'] = None
     p['numRepeats'] = 1
     p['loadFromFile'] = False
+    p['engine'] = 'object'      ## 'object' for Person objects, 'array' for the NumPy column store
+    p['resultCache'] = 'runcache'   ## where batch runs are cached; None to always rerun
+    p['resultsStore'] = 'results.sqlite'    ## where batch runs' yearly series are kept; None for nowhere
+    p['checkpointEvery'] = 0    ## years between checkpoints; 0 for none
+    p['checkpointFile'] = 'checkpoint.gz'
+    p['instrumentReport'] = None    ## file for per-phase timings and work counts (.json or .csv; {seed} is replaced by the seed key); None for none
 
     ## Mortality statistics
     p['baseDieProb'] = 0.0001
@@ -36,6 +48,8 @@ def init_params():
     p['maleAgeDieProb'] = 0.00021
     p['femaleAgeScaling'] = 15.5
     p['femaleAgeDieProb'] = 0.00019
+    p['preEmpiricalMortality'] = False     ## apply the made-up hazard above before 1951
+    p['deathSkipsNextPerson'] = True    ## nobody straight after a death gets a chance to die that year, as in the calibrated runs
     p['num5YearAgeClasses'] = 28
 
     ## Transitions to care statistics
@@ -165,44 +179,185 @@ def basicRun(p):
     
 def batchRun(num):
     p['interactiveGraphics'] = False
+    masterSeed = p['favouriteSeed']
+    if masterSeed is None:
+        masterSeed = newMasterSeed()
     dataFile = open('batchRunData.txt','w')
     for i in range ( 0, num ):
             print "Doing batch run: ", i
             taxList = []
             s = Sim(p)
-            tax = s.run()
+            tax = s.run(seedKey(masterSeed, i))
             taxList.append(tax)
             print "Social care cost per taxpayer: ", tax
             dataFile.write(str(i) + "\t" + str(tax) + "\n")
     dataFile.close()
     
+#######################################################
+## Ensembles of runs, spread over a pool of worker processes
+
+def frozenParams(params):
+    """An immutable copy of a parameter dict, to hand to one job."""
+    return tuple(sorted(params.items()))
+
+def runJob(job):
+    """Run one replicate of one design point. Called in the worker processes."""
+    point, rep, params, key = job
+    s = Sim(dict(params))
+    tax, seed = s.run(key)
+    return point, rep, tax, seed, runSeries(s)
+
+def openResultsStore(base):
+    """The results store named by the base parameters, or None if there isn't one."""
+    if base['resultsStore']:
+        return ResultsStore(base['resultsStore'])
+    return None
+
+def pointSeed(params):
+    """The spawn index for a design point: the first 60 bits of the hash of its model parameters."""
+    return int(paramHash(params)[:15], 16)
+
+def run_ensemble(design, reps, workers = 1, base = None, masterSeed = None):
+    """
+    Run reps replicates of every point in design, a list of dicts of
+    the parameters that differ from the base set (p by default).
+    Every job gets its own frozen parameter set, so nothing is changed
+    in between runs, and with workers > 1 the jobs are shared out over
+    a process pool. Replicate r of a point is seeded from the key
+    masterSeed/h/r, where h comes from the hash of the point's model
+    parameters (see pointSeed), so the same master seed gives the same
+    results however many workers there are and wherever the point
+    sits in the design. The master seed defaults to the
+    base set's favouriteSeed, or a fresh one if that is None.
+    Finished runs are kept in a ResultCache in the directory named by
+    the base set's resultCache (None for no cache) and not run again,
+    so rerunning an interrupted sweep with the same master seed picks
+    up where it stopped. The yearly series of every run are kept in
+    the ResultsStore named by the base set's resultsStore, if any.
+    Returns one list of (tax, seed key) pairs per design point, in
+    design and replicate order whatever order they finish in.
+    """
+    if base is None:
+        base = p
+    if masterSeed is None:
+        masterSeed = base['favouriteSeed']
+    if masterSeed is None:
+        masterSeed = newMasterSeed()
+    print "Master seed:", masterSeed
+    if base['resultCache']:
+        cache = ResultCache(base['resultCache'])
+    else:
+        cache = None
+    store = openResultsStore(base)
+    results = [ [ None ] * reps for point in design ]
+    cacheKeys = {}
+    pointParams = []
+    jobs = []
+    for point in range(len(design)):
+        params = dict(base)
+        params.update(design[point])
+        params['verboseDebugging'] = False
+        params['singleRunGraphs'] = False
+        params['interactiveGraphics'] = False
+        params['checkpointEvery'] = 0
+        pointParams.append(params)
+        frozen = frozenParams(params)
+        for rep in range(reps):
+            key = seedKey(masterSeed, pointSeed(params), rep)
+            if cache is not None:
+                cacheKeys[(point, rep)] = cache.key(params, key)
+                cached = cache.get(cacheKeys[(point, rep)])
+                if cached is not None:
+                    results[point][rep] = (cached['tax'], str(cached['seed']))
+                    continue
+            jobs.append((point, rep, frozen, key))
+    print len(jobs), "runs to do,", len(design) * reps - len(jobs), "found in the cache"
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        finished = pool.imap(runJob, jobs)
+    else:
+        pool = None
+        finished = (runJob(job) for job in jobs)
+    for point, rep, tax, seed, series in finished:
+        print "Design point", point, "replicate", rep, ":", tax
+        results[point][rep] = (tax, seed)
+        ## Series go into the store before the run is marked done in the cache
+        if store is not None:
+            store.add(pointParams[point], seed, tax, series)
+            store.flush()
+        if cache is not None:
+            cache.put(cacheKeys[(point, rep)], { 'tax': tax, 'seed': seed })
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if store is not None:
+        store.close()
+    return results
+
+def run_branches(variants, reps, workers = 1, base = None, masterSeed = None):
+    """
+    Like run_ensemble, for designs that only vary parameters used from
+    p['thePresent'] on (see branching.py): each replicate's burn-in is
+    simulated once and shared by every variant. Replicate r is seeded
+    from masterSeed/r for all the variants, and workers is the number
+    of variants run at once. Returns one list of (tax, seed key) pairs
+    per variant, in variant and replicate order.
+    """
+    if base is None:
+        base = p
+    if masterSeed is None:
+        masterSeed = base['favouriteSeed']
+    if masterSeed is None:
+        masterSeed = newMasterSeed()
+    print "Master seed:", masterSeed
+    params = dict(base)
+    params['verboseDebugging'] = False
+    params['singleRunGraphs'] = False
+    params['interactiveGraphics'] = False
+    params['checkpointEvery'] = 0
+    store = openResultsStore(base)
+    results = [ [ None ] * reps for variant in variants ]
+    for rep in range(reps):
+        print "Replicate", rep, "of", len(variants), "variants"
+        runs = runBranches(params, variants, seedKey(masterSeed, rep), workers,
+                           keepSeries = store is not None)
+        for variant in range(len(variants)):
+            if store is not None:
+                runs[variant], series = runs[variant]
+                variantParams = dict(params)
+                variantParams.update(variants[variant])
+                store.add(variantParams, runs[variant][1], runs[variant][0], series)
+            results[variant][rep] = runs[variant]
+        if store is not None:
+            store.flush()
+    if store is not None:
+        store.close()
+    return results
+
 #######################################################
 ## Retirement age run (no graphics)
  
-def retireRun(reps):   
+def retireRun(reps, workers = 1):   
     taxMeans = []
     taxSEs = []
-    p['verboseDebugging'] = False
-    p['singleRunGraphs'] = False
-    p['interactiveGraphics'] = False
     dataFile = open('retirementAgeData2.txt','w')
     #p['ageingParentList'] = [50, 55, 65, 70, 75, 80]    
-    for variableCare in p['ageingParentList']:
-            p['ageOfRetirement'] = variableCare
-            print "Trying retirement age: ", variableCare
+    design = [ { 'ageOfRetirement': variableCare } for variableCare in p['ageingParentList'] ]
+    results = run_ensemble(design, reps, workers)
+    for variableCare, runs in zip(p['ageingParentList'], results):
             taxList = []
             for i in range ( 0, reps ):
-                print i,
-                s = Sim(p)
-                tax = s.run()
+                tax, seed = runs[i]
                 taxList.append(tax)
-                print tax
                 dataFile.write(str(variableCare) + "\t" + str(i) + "\t" + str(tax) + "\n")
-            taxMeans.append(pylab.mean(taxList))
-            taxSEs.append(pylab.std(taxList) / math.sqrt(reps))
+            taxMeans.append(np.mean(taxList))
+            taxSEs.append(np.std(taxList) / math.sqrt(reps))
     
     dataFile.close()
     
+    ## Only this batch draws anything, so only it needs pylab
+    import pylab
     indices1 = pylab.arange(len(p['ageingParentList']))
     
     taxFig = pylab.figure()
@@ -219,14 +374,7 @@ def retireRun(reps):
 #######################################################
 ##runs for sensitivity analysis using GEM-SA
     
-def gemRun(reps):    
-    taxMeans = []
-    taxSEs = []
-    
-    p['verboseDebugging'] = False
-    p['singleRunGraphs'] = False
-    p['interactiveGraphics'] = False
-    
+def gemRun(reps, workers = 1):    
     dataFile = open('GEMSA data new.txt','a')
     meansFile = open('GEMSA means new.txt', 'a')
     outFile = open('GEMSA outputs new.txt', 'a')
@@ -240,32 +388,26 @@ def gemRun(reps):
 #    retiredHoursList = [ 20.0 ] 
 #    retiredAgeList = [ 60.0 ]
     
+    settings = []
     for variableCare in p['ageingParentList']:
         for variableProb in p['careProbList']:
             for variableRetired in p['retiredHoursList']:
                 for variableAge in p['retiredAgeList']:
-                    p['agingParentsMoveInWithKids'] = variableCare
-                    p['personCareProb'] = variableProb
-                    p['retiredHours'] = variableRetired
-                    p['ageOfRetirement'] = variableAge
-                    print "Trying parents-moving-in probability: ", variableCare
-                    print "Trying person care probability: ", variableProb
-                    print "Trying retired hours: ", variableRetired
-                    print "Trying retirement age: ", variableAge
-                    taxList = []
-                    taxSum = 0.0
-                    meansFile.write(str(variableCare) + "\t" + str(variableProb) + "\t" + str(variableRetired) + "\t" + str(variableAge) + "\n")
-                    for i in range ( 0, reps ):
-                        print i,
-                        s = Sim(p)
-                        tax, seed = s.run()
-                        taxList.append(tax)
-                        taxSum += tax
-                        print tax
-                        dataFile.write(str(seed) + "\t" + str(variableCare) + "\t" + str(variableProb) + "\t" + str(variableRetired) + "\t" + str(variableAge) + "\t" + str(tax) + "\n")    
-                    taxMeans.append(pylab.mean(taxList))
-                    outFile.write(str(taxSum/reps) + "\n")
-                    taxSEs.append(pylab.std(taxList) / math.sqrt(reps))
+                    settings.append((variableCare, variableProb, variableRetired, variableAge))
+    design = [ { 'agingParentsMoveInWithKids': variableCare,
+                 'personCareProb': variableProb,
+                 'retiredHours': variableRetired,
+                 'ageOfRetirement': variableAge }
+               for variableCare, variableProb, variableRetired, variableAge in settings ]
+    results = run_ensemble(design, reps, workers)
+
+    for (variableCare, variableProb, variableRetired, variableAge), runs in zip(settings, results):
+        taxSum = 0.0
+        meansFile.write(str(variableCare) + "\t" + str(variableProb) + "\t" + str(variableRetired) + "\t" + str(variableAge) + "\n")
+        for tax, seed in runs:
+            taxSum += tax
+            dataFile.write(str(seed) + "\t" + str(variableCare) + "\t" + str(variableProb) + "\t" + str(variableRetired) + "\t" + str(variableAge) + "\t" + str(tax) + "\n")    
+        outFile.write(str(taxSum/reps) + "\n")
     
     dataFile.close()
     meansFile.close()
@@ -274,50 +416,25 @@ def gemRun(reps):
 #######################################################
 ##runs for sensitivity analysis using GEM-SA - LPtau and Maximin LH
     
-def sensitivityRun(runtype, ageingList, careList, retiredHList, retiredAList, reps):    
-    taxMeans = []
-    taxSEs = []
-    
-    p['verboseDebugging'] = False
-    p['singleRunGraphs'] = False
-    p['interactiveGraphics'] = False
-    
+def sensitivityRun(runtype, ageingList, careList, retiredHList, retiredAList, reps, workers = 1):    
     dataFile = open(runtype + ' GEMSA data.txt','a')
     meansFile = open(runtype + ' GEMSA means.txt', 'a')
     outFile = open(runtype + ' GEMSA outputs.txt', 'a')
     
-#    agingParentList = [ 0.0, 0.1, 0.2, 0.4 ] 
-#    careProbList = [ 0.0004, 0.0008, 0.0012, 0.0016 ] 
-#    retiredHoursList = [ 20.0, 30.0, 40.0, 60.0 ] 
-#    retiredAgeList = [ 60.0 ]
-#    ageingParentList = [ 0.0, 0.1 ] 
-#    careProbList = [ 0.0004 ] 
-#    retiredHoursList = [ 20.0 ] 
-#    retiredAgeList = [ 60.0 ]
-    
+    design = [ { 'agingParentsMoveInWithKids': ageingList[run],
+                 'personCareProb': careList[run],
+                 'retiredHours': retiredHList[run],
+                 'ageOfRetirement': retiredAList[run] }
+               for run in xrange(len(ageingList)) ]
+    results = run_ensemble(design, reps, workers)
+
     for run in xrange(len(ageingList)):
-        p['agingParentsMoveInWithKids'] = ageingList[run]
-        p['personCareProb'] = careList[run]
-        p['retiredHours'] = retiredHList[run]
-        p['ageOfRetirement'] = retiredAList[run]
-        print "Trying parents-moving-in probability: ", ageingList[run]
-        print "Trying person care probability: ", careList[run]
-        print "Trying retired hours: ", retiredHList[run]
-        print "Trying retirement age: ", retiredAList[run]
-        taxList = []
         taxSum = 0.0
         meansFile.write(str(ageingList[run]) + "\t" + str(careList[run]) + "\t" + str(retiredHList[run]) + "\t" + str(retiredAList[run]) + "\n")
-        for i in range ( 0, reps ):
-            print i,
-            s = Sim(p)
-            tax, seed = s.run()
-            taxList.append(tax)
+        for tax, seed in results[run]:
             taxSum += tax
-            print tax
             dataFile.write(str(seed) + "\t" + str(ageingList[run]) + "\t" + str(careList[run]) + "\t" + str(retiredHList[run]) + "\t" + str(retiredAList[run]) + "\t" + str(tax) + "\n")    
-        taxMeans.append(pylab.mean(taxList))
         outFile.write(str(taxSum/reps) + "\n")
-        taxSEs.append(pylab.std(taxList) / math.sqrt(reps))
     
     dataFile.close()
     meansFile.close()
@@ -327,103 +444,67 @@ def sensitivityRun(runtype, ageingList, careList, retiredHList, retiredAList, re
 #######################################################
 ##runs for sensitivity analysis using GEM-SA - LPtau and Maximin LH
     
+## The parameters set by each row of the 22-parameter design, in row order
+## (personCareProb appears twice; the later row wins, as it always has)
+largeDesignParams = [ 'agingParentsMoveInWithKids', 'personCareProb', 'retiredHours',
+                      'ageOfRetirement', 'baseDieProb', 'babyDieProb', 'personCareProb',
+                      'maleAgeCareScaling', 'femaleAgeCareScaling', 'childHours',
+                      'homeAdultHours', 'workingAdultHours', 'lowCareHandicap',
+                      'growingPopBirthProb', 'basicDivorceRate', 'variableDivorce',
+                      'basicMaleMarriageProb', 'basicFemaleMarriageProb',
+                      'probApartWillMoveTogether', 'coupleMovesToExistingHousehold',
+                      'basicProbAdultMoveOut', 'variableMoveBack' ]
+
+## The parameters set by each row of the 10-parameter design, in row order
+tenParamsDesignParams = [ 'agingParentsMoveInWithKids', 'baseCareProb', 'retiredHours',
+                          'ageOfRetirement', 'personCareProb', 'maleAgeCareScaling',
+                          'femaleAgeCareScaling', 'childHours', 'homeAdultHours',
+                          'workingAdultHours' ]
+
+def designFromList(names, input_list):
+    """One dict of parameter settings per column of a design, given the name for each row."""
+    sim_list = np.array(input_list)
+    design = []
+    for run in xrange(sim_list.shape[1]):
+        point = {}
+        for row in xrange(len(names)):
+            point[names[row]] = sim_list[row,run]
+        design.append(point)
+    return design
+
 # def sensitivityLarge(runtype, ageingList, careList, retiredHList, retiredAList, baseDieList, babyDieList, personCareList, maleCareList, femaleCareList, \
 #     childHoursList, homeAdultList, workingAdultList, lowCareList, growingBirthList, basicDivorceList, variableDivorceList, basicMaleMarriageList, \
 #     basicFemaleMarriageList, probMoveList, moveHouseholdList, probMoveOutList, probMoveBackList, reps): 
-def sensitivityLarge(runtype, input_list, reps):   
-    taxMeans = []
-    taxSEs = []
-    
-    p['verboseDebugging'] = False
-    p['singleRunGraphs'] = False
-    p['interactiveGraphics'] = False
-    
+def sensitivityLarge(runtype, input_list, reps, workers = 1):   
     outFile = open(runtype + ' GEMSA outputs large.txt', 'a')
     
-    for run in xrange(len(input_list[0])):
-        print("Running simulation number {}...".format(run))
-        print("Number of reps: {}".format(reps))
-        sim_list = np.array(input_list)
-        print(sim_list)
-        p['agingParentsMoveInWithKids'] = sim_list[0,run]
-        print(p['agingParentsMoveInWithKids'])
-        p['personCareProb'] = sim_list[1,run]
-        p['retiredHours'] = sim_list[2,run]
-        p['ageOfRetirement'] = sim_list[3,run]
-        p['baseDieProb'] = sim_list[4,run]
-        p['babyDieProb'] = sim_list[5,run]
-        p['personCareProb'] = sim_list[6,run]
-        p['maleAgeCareScaling'] = sim_list[7,run]
-        p['femaleAgeCareScaling'] = sim_list[8,run]
-        p['childHours'] = sim_list[9,run]
-        p['homeAdultHours'] = sim_list[10,run]
-        p['workingAdultHours'] = sim_list[11,run]
-        p['lowCareHandicap'] = sim_list[12,run]
-        p['growingPopBirthProb'] = sim_list[13,run]
-        p['basicDivorceRate'] = sim_list[14,run]
-        p['variableDivorce'] = sim_list[15,run] 
-        p['basicMaleMarriageProb'] =  sim_list[16,run]
-        p['basicFemaleMarriageProb'] = sim_list[17,run]
-        p['probApartWillMoveTogether'] = sim_list[18,run]
-        p['coupleMovesToExistingHousehold'] = sim_list[19,run]
-        p['basicProbAdultMoveOut'] = sim_list[20,run]
-        p['variableMoveBack'] = sim_list[21,run]
-        taxList = []
+    design = designFromList(largeDesignParams, input_list)
+    print("Running {} simulations of {} reps each...".format(len(design), reps))
+    results = run_ensemble(design, reps, workers)
+
+    for runs in results:
         taxSum = 0.0
-        for i in range ( 0, reps ):
-            print i,
-            s = Sim(p)
-            tax, seed = s.run()
-            taxList.append(tax)
+        for tax, seed in runs:
             taxSum += tax
-            print tax
-        taxMeans.append(pylab.mean(taxList))
         outFile.write(str(taxSum/reps) + "\n" + str(seed) + "\n")
-        taxSEs.append(pylab.std(taxList) / math.sqrt(reps))
     
     outFile.close()
 
 #######################################################
 ##runs for sensitivity analysis using GEM-SA - LPtau and Maximin LH, 10 params
  
-def sensitivityTenParams(runtype, input_list, reps):   
-    taxMeans = []
-    taxSEs = []
-    
-    p['verboseDebugging'] = False
-    p['singleRunGraphs'] = False
-    p['interactiveGraphics'] = False
-    
+def sensitivityTenParams(runtype, input_list, reps, workers = 1):   
     outFile = open(runtype + ' GEMSA outputs.txt', 'a')
     
-    for run in xrange(len(input_list[0])):
-        print("Running simulation number {}...".format(run))
-        print("Number of reps: {}".format(reps))
-        sim_list = np.array(input_list)
-        print(sim_list)
-        p['agingParentsMoveInWithKids'] = sim_list[0,run]
-        p['baseCareProb'] = sim_list[1,run]
-        p['retiredHours'] = sim_list[2,run]
-        p['ageOfRetirement'] = sim_list[3,run]
-        p['personCareProb'] = sim_list[4,run]
-        p['maleAgeCareScaling'] = sim_list[5,run]
-        p['femaleAgeCareScaling'] = sim_list[6,run]
-        p['childHours'] = sim_list[7,run]
-        p['homeAdultHours'] = sim_list[8,run]
-        p['workingAdultHours'] = sim_list[9,run]
-        
-        taxList = []
+    design = designFromList(tenParamsDesignParams, input_list)
+    print("Running {} simulations of {} reps each...".format(len(design), reps))
+    results = run_ensemble(design, reps, workers)
+
+    for runs in results:
         taxSum = 0.0
-        for i in range ( 0, reps ):
-            print i,
-            s = Sim(p)
-            tax, seed = s.run()
-            taxList.append(tax)
+        for tax, seed in runs:
             taxSum += tax
-            print tax
-        taxMeans.append(pylab.mean(taxList))
         outFile.write(str(taxSum/reps) + "\t" + str(seed) + "\n")
-        taxSEs.append(pylab.std(taxList) / math.sqrt(reps))
     
     outFile.close()
 
@@ -490,6 +571,12 @@ def loadCommandLine(dict):
         help='bigly sensitivity analysis batch with maximin latin hypercube sampling.')
     group.add_argument('-t', '--tenparams', metavar='T', type=int, default=0,
         help='10 parameter sensitivity analysis batch with maximin latin hypercube sampling.')
+    parser.add_argument('-w', '--workers', metavar='W', type=int, default=1,
+        help='number of worker processes to share batch runs between.')
+    parser.add_argument('-s', '--seed', metavar='S', type=int, default=None,
+        help='master seed that every run\'s seed is derived from.')
+    parser.add_argument('-c', '--cache', metavar='DIR', default=None,
+        help='directory of cached batch runs to reuse and add to;\n"" for none.')
     args = parser.parse_args()
     print("~ Filename: {}".format(args.file))
     print("~ Number:   {}".format(args.num))
@@ -499,6 +586,12 @@ def loadCommandLine(dict):
     print("~ Maximin: {}".format(args.maximin))
     print("~ Big SA: {}".format(args.bigly))
     print("~Ten Params: {}".format(args.tenparams))
+    print("~ Workers: {}".format(args.workers))
+    print("~ Seed: {}".format(args.seed))
+    if args.seed is not None:
+        dict['favouriteSeed'] = args.seed
+    if args.cache is not None:
+        dict['resultCache'] = args.cache
     if args.file:
         #agingParentList = json.load(retireList, parse_float=decimal.Decimal)
         res = loadParamFile (args.file, dict)
@@ -510,7 +603,7 @@ def loadCommandLine(dict):
         p['ageingParentList'] = []
         res = loadParamFile('retire.json', dict)
         print("List = {}".format(dict))
-        retireRun(args.retire)
+        retireRun(args.retire, args.workers)
     elif args.gem:
         p['ageingParentList'] = [] 
         p['careProbList'] = [] 
@@ -518,7 +611,7 @@ def loadCommandLine(dict):
         p['retiredAgeList'] = []
         res = loadParamFile('gem.json', dict)
         print("List = {}".format(dict))
-        gemRun(args.gem)
+        gemRun(args.gem, args.workers)
     elif args.lptau:
         sim_array = np.genfromtxt('lptau-4params.txt', delimiter=' ')
         sim_list = list(sim_array.T)
@@ -531,7 +624,7 @@ def loadCommandLine(dict):
         # print(careProbSettings)
         # print(retiredHoursSettings)
         # print(retiredAgeSettings)
-        sensitivityRun('LPtau', ageingParentSettings, careProbSettings, retiredHoursSettings, retiredAgeSettings, args.lptau)
+        sensitivityRun('LPtau', ageingParentSettings, careProbSettings, retiredHoursSettings, retiredAgeSettings, args.lptau, args.workers)
     elif args.maximin:
         sim_array = np.genfromtxt('latinhypercube-4params.txt', delimiter=' ')
         sim_list = list(sim_array.T)
@@ -544,19 +637,19 @@ def loadCommandLine(dict):
         # print(careProbSettings)
         # print(retiredHoursSettings)
         # print(retiredAgeSettings)
-        sensitivityRun('Maximin', ageingParentSettings, careProbSettings, retiredHoursSettings, retiredAgeSettings, args.maximin)
+        sensitivityRun('Maximin', ageingParentSettings, careProbSettings, retiredHoursSettings, retiredAgeSettings, args.maximin, args.workers)
     elif args.bigly:
         sim_array = np.genfromtxt('latinhypercube-22params.txt', delimiter=' ')
         sim_list = list(sim_array.T)
         #print(sim_list)
         np.savetxt('hypercube22_GEMSA_inputs.txt', sim_array, fmt='%1.8f', delimiter='\t', newline='\n')
-        sensitivityLarge('hypercube22', sim_list, args.bigly)
+        sensitivityLarge('hypercube22', sim_list, args.bigly, args.workers)
     elif args.tenparams:
         sim_array = np.genfromtxt('lptau10-1600runsfull.txt', delimiter='\t')
         sim_list = list(sim_array.T)
         #print(sim_list)
         np.savetxt('LPtau1600runs_GEMSA_inputs.txt', sim_array, fmt='%1.8f', delimiter='\t', newline='\n')
-        sensitivityTenParams('LPtau1600runs', sim_list, args.tenparams)
+        sensitivityTenParams('LPtau1600runs', sim_list, args.tenparams, args.workers)
 
     else:
         basicRun(p)
@@ -565,6 +658,8 @@ def loadCommandLine(dict):
 # Load the default values, overwriting and adding to the initial p values
 loadParamFile("default.json", p)
 
-# Load values based upon the command line file passed (if any).
-loadCommandLine (p)
-#print ("p = {}".format(p))
\ No newline at end of file
+# Load values based upon the command line file passed (if any), unless
+# we've just been imported (e.g. by benchmark.py) for the batch functions
+if __name__ == '__main__':
+    loadCommandLine (p)
+    #print ("p = {}".format(p))
\ No newline at end of file
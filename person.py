@@ -1,8 +1,27 @@
-
 import random
+from house import Slotted
+
+## Integer codes for status and sex, as kept by each Person and in the
+## array population store, and the names they stand for, which are only
+## needed for display
+statusNames = [ 'child', 'adult at home', 'independent adult', 'retired' ]
+statusCodes = dict([ (statusNames[i], i) for i in range(len(statusNames)) ])
+sexNames = [ 'male', 'female' ]
+sexCodes = dict([ (sexNames[i], i) for i in range(len(sexNames)) ])
 
-class Person:
-    """The person class stores information about a person in the sim."""
+## The codes to compare against
+CHILD, AT_HOME, INDEPENDENT, RETIRED = range(len(statusNames))
+MALE, FEMALE = range(len(sexNames))
+
+class Person(Slotted):
+    """
+    The person class stores information about a person in the sim.
+    Status and sex are kept as integer codes (see statusCodes and
+    sexCodes); status and sex give and take their names, for display.
+    """
+    __slots__ = [ 'mother', 'father', 'children', 'birthdate', 'careNeedLevel',
+                  'dead', 'partner', 'sexCode', 'house', 'sec', 'statusCode',
+                  'careRequired', 'careAvailable', 'movedThisYear', 'index', 'id' ]
     counter = 1
     def __init__ (self, mother, father, birthYear, sex, house, sec):
         self.mother = mother
@@ -13,24 +32,96 @@ class Person:
         self.dead = False
         self.partner = None
         if sex == 'random':
-            self.sex = random.choice(['male', 'female'])
+            self.sexCode = random.choice([ MALE, FEMALE ])
         else:
-            self.sex = sex
+            self.sexCode = sexCodes[sex]
         self.house = house
         self.sec = sec
-        self.status = 'child'
+        self.statusCode = CHILD
         self.careRequired = 0
         self.careAvailable = 0
         self.movedThisYear = False
+        self.index = None
         self.id = Person.counter
         Person.counter += 1
 
+    @property
+    def status(self):
+        return statusNames[self.statusCode]
+
+    @status.setter
+    def status(self, status):
+        self.statusCode = statusCodes[status]
+
+    @property
+    def sex(self):
+        return sexNames[self.sexCode]
+
+    @sex.setter
+    def sex(self, sex):
+        self.sexCode = sexCodes[sex]
+
+class PopulationCounters:
+    """
+    Running counts of the living population, kept up to date as people
+    are born, die, pair up, split up, change status or come to need
+    care, so that nobody has to recount them every year. Women are
+    counted by birth year, so the number above any age can be read off
+    for any year.
+    """
+    def __init__ (self):
+        self.living = 0
+        self.byStatus = {}
+        self.byCareLevel = {}
+        self.womenByBirthYear = {}
+        self.marriedWomenByBirthYear = {}
+
+    def add(self, person, n = 1):
+        """Count a living person in (or, with n = -1, out of) every tally."""
+        self.living += n
+        self.byStatus[person.statusCode] = self.byStatus.get(person.statusCode, 0) + n
+        self.byCareLevel[person.careNeedLevel] = self.byCareLevel.get(person.careNeedLevel, 0) + n
+        if person.sexCode == FEMALE:
+            year = person.birthdate
+            self.womenByBirthYear[year] = self.womenByBirthYear.get(year, 0) + n
+            if person.partner != None:
+                self.marriedWomenByBirthYear[year] = self.marriedWomenByBirthYear.get(year, 0) + n
+
+    def remove(self, person):
+        self.add(person, -1)
+
+    def taxPayers(self):
+        return self.byStatus.get(AT_HOME, 0) + self.byStatus.get(INDEPENDENT, 0)
+
+    def women(self, year, minAge):
+        """Living women who are at least minAge in the given year."""
+        return sum([ n for b, n in self.womenByBirthYear.items() if year - b >= minAge ])
+
+    def marriedWomen(self, year, minAge):
+        """Living women with a partner who are at least minAge in the given year."""
+        return sum([ n for b, n in self.marriedWomenByBirthYear.items() if year - b >= minAge ])
+
+    def differences(self, other):
+        """Describe every tally on which two sets of counters disagree."""
+        found = []
+        for name in [ 'living', 'byStatus', 'byCareLevel',
+                      'womenByBirthYear', 'marriedWomenByBirthYear' ]:
+            mine = getattr(self, name)
+            theirs = getattr(other, name)
+            if type(mine) == type({}):
+                mine = dict([ (k, v) for k, v in mine.items() if v != 0 ])
+                theirs = dict([ (k, v) for k, v in theirs.items() if v != 0 ])
+            if mine != theirs:
+                found.append(name + ": " + str(mine) + " but recounted " + str(theirs))
+        return found
+
 class Population:
     """The population class stores a collection of persons."""
     def __init__ (self, initial, startYear,
                   minStartAge, maxStartAge):
         self.allPeople = []
         self.livingPeople = []
+        self.counters = PopulationCounters()
         for i in range(initial / 2):
             birthYear = startYear - random.randint(minStartAge,maxStartAge)
             newMan = Person(None, None,
@@ -38,15 +129,66 @@ class Population:
             newWoman = Person(None, None,
                               birthYear, 'female', None, None )
 
-            newMan.status = 'independent adult'
-            newWoman.status = 'independent adult'
-            
-            newMan.partner = newWoman
-            newWoman.partner = newMan
-            
-            self.allPeople.append(newMan)
-            self.livingPeople.append(newMan)
-            self.allPeople.append(newWoman)
-            self.livingPeople.append(newWoman)
+            self.addPerson(newMan)
+            self.addPerson(newWoman)
 
+            self.setStatus(newMan, INDEPENDENT)
+            self.setStatus(newWoman, INDEPENDENT)
             
+            self.setPartners(newMan, newWoman)
+
+    def recount(self):
+        """Counters built from scratch from the living population."""
+        counters = PopulationCounters()
+        for person in self.livingPeople:
+            counters.add(person)
+        return counters
+
+    ## All changes to a person's family, house, status or health go
+    ## through the methods below so that the counters, and subclasses
+    ## keeping extra bookkeeping (e.g. the array store), see every one
+    ## of them.
+
+    def addPerson(self, person):
+        """Add a newly created person to the living population."""
+        person.index = len(self.allPeople)
+        self.allPeople.append(person)
+        self.livingPeople.append(person)
+        self.counters.add(person)
+
+    def markDead(self, person):
+        """Flag a person as dead; removal from livingPeople is up to the caller."""
+        if person.dead == False:
+            self.counters.remove(person)
+        person.dead = True
+
+    def setStatus(self, person, status):
+        """Give a person a new status, by its code (CHILD, AT_HOME, INDEPENDENT or RETIRED)."""
+        self.counters.remove(person)
+        person.statusCode = status
+        self.counters.add(person)
+
+    def setCareNeedLevel(self, person, level):
+        self.counters.remove(person)
+        person.careNeedLevel = level
+        self.counters.add(person)
+
+    def setPartners(self, man, woman):
+        self.counters.remove(woman)
+        man.partner = woman
+        woman.partner = man
+        self.counters.add(woman)
+
+    def clearPartner(self, person):
+        if person.dead == False:
+            self.counters.remove(person)
+        person.partner = None
+        if person.dead == False:
+            self.counters.add(person)
+
+    def setParents(self, person, mother, father):
+        person.mother = mother
+        person.father = father
+
+    def setHouse(self, person, house):
+        person.house = house
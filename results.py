@@ -0,0 +1,90 @@
+"""
+A store for the full yearly output of every run, not just the final
+tax burden, so that new questions can be asked of old sweeps without
+running them again.
+
+The store is a SQLite file with one row per run, keyed by the hash of
+the run's model parameters (paramHash in cache.py) and its seed key,
+so the replicates of a design point from every sweep, whatever their
+master seed, share a hash. Each of
+the series below is kept as a fixed-width blob of float64s, one per
+simulated year, so a whole column of runs loads straight into an array
+with one row per run and one column per year.
+"""
+
+import sqlite3
+import numpy as np
+from cache import paramHash
+
+
+## The yearly series kept for each run
+seriesNames = [ 'pops', 'avgHouseholdSize', 'totalCareDemand', 'totalCareSupply',
+                'numTaxpayers', 'totalUnmetNeed', 'totalFamilyCare', 'marriageProp' ]
+
+
+def runSeries(sim):
+    """The series of a finished Sim, as float64 arrays, plus its first year."""
+    series = {}
+    series['firstYear'] = sim.times[0]
+    for name in seriesNames:
+        series[name] = np.array(getattr(sim, name), dtype=float)
+    return series
+
+
+class ResultsStore:
+    """The SQLite file of runs' series."""
+    def __init__ (self, path = 'results.sqlite'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        columns = ', '.join([ name + ' BLOB' for name in seriesNames ])
+        self.connection.execute('CREATE TABLE IF NOT EXISTS runs '
+                                '(paramHash TEXT, seed TEXT, tax REAL, '
+                                'firstYear INTEGER, years INTEGER, ' + columns + ', '
+                                'PRIMARY KEY (paramHash, seed))')
+        self.connection.commit()
+        self.pending = []
+
+    def add(self, params, seed, tax, series):
+        """Queue a run to be written with the next flush."""
+        row = [ paramHash(params), str(seed), tax,
+                int(series['firstYear']), len(series['pops']) ]
+        for name in seriesNames:
+            row.append(sqlite3.Binary(series[name].astype('<f8').tobytes()))
+        self.pending.append(row)
+
+    def flush(self):
+        """Write every queued run in one transaction."""
+        if len(self.pending) == 0:
+            return
+        marks = ', '.join([ '?' ] * (5 + len(seriesNames)))
+        self.connection.executemany('INSERT OR REPLACE INTO runs VALUES (' + marks + ')',
+                                    self.pending)
+        self.connection.commit()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def load(self, name, params = None):
+        """
+        One series for every stored run (or every run with the given
+        parameters): the list of (paramHash, seed, firstYear) for the
+        runs, and an array with a row per run and a column per year,
+        padded with NaN where runs are of different lengths.
+        """
+        query = 'SELECT paramHash, seed, firstYear, ' + name + ' FROM runs'
+        arguments = []
+        if params is not None:
+            query += ' WHERE paramHash = ?'
+            arguments.append(paramHash(params))
+        rows = self.connection.execute(query + ' ORDER BY rowid', arguments).fetchall()
+
+        keys = [ (str(row[0]), str(row[1]), row[2]) for row in rows ]
+        values = [ np.frombuffer(bytes(row[3]), dtype='<f8') for row in rows ]
+        width = max([ len(v) for v in values ] + [ 0 ])
+        table = np.empty((len(values), width))
+        table.fill(np.nan)
+        for i in range(len(values)):
+            table[i,:len(values[i])] = values[i]
+        return keys, table
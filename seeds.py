@@ -0,0 +1,54 @@
+"""
+Seeds for the simulation's random number generators.
+
+Every run is identified by a seed key: a master seed followed by the
+path of spawn indices that leads to the run, joined with '/', e.g.
+'20180612/17' for run 17 of a batch with master seed 20180612. The
+ensembles in maintest.py use a number taken from the hash of a design
+point's parameters in place of its position, so a point keeps its seeds
+whichever design it is part of. The generators' state is derived from
+the key by hashing it, in the manner of numpy's SeedSequence, so every
+key gives a stream independent of every other key's, however many
+workers share a sweep, and any run can be replayed exactly from its
+recorded key.
+"""
+
+import hashlib
+import random
+import time
+import numpy as np
+
+
+def newMasterSeed():
+    """A fresh master seed from the clock, for runs that weren't given one."""
+    return int(time.time() * 1000000) % (2 ** 32)
+
+
+def seedKey(masterSeed, *path):
+    """The key for the run reached from masterSeed by the given spawn indices."""
+    return '/'.join([ str(int(x)) for x in (masterSeed,) + path ])
+
+
+def spawnKey(key, *path):
+    """The key of a child of an existing key."""
+    return '/'.join([ key ] + [ str(int(x)) for x in path ])
+
+
+def seedWords(key, stream):
+    """
+    Eight 32-bit words of seed material for one named stream of a key,
+    so that e.g. the 'random' and 'numpy' generators of a run are
+    independent of each other too.
+    """
+    digest = hashlib.sha256((key + ':' + stream).encode('ascii')).digest()
+    return np.frombuffer(digest, dtype='<u4').astype(np.uint32)
+
+
+def seedGenerators(key):
+    """
+    Seed the random module from the key, and return a numpy
+    RandomState seeded from it too.
+    """
+    words = seedWords(key, 'random')
+    random.seed(sum([ int(w) << (32 * i) for i, w in enumerate(words) ]))
+    return np.random.RandomState(seedWords(key, 'numpy'))
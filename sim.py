@@ -1,24 +1,48 @@
 
 from person import Person
 from person import Population
+from person import statusNames
+from person import CHILD, AT_HOME, INDEPENDENT, RETIRED
+from person import MALE, FEMALE
 from house import House
 from house import Town
 from house import Map
+from arraypop import ArrayPopulation
+from arraypop import arrayPopulationFrom
+from seeds import seedKey
+from seeds import newMasterSeed
+from seeds import seedGenerators
+from tables import loadTable
+from instrument import Instruments
 import random
 import math
-import pylab
-import Tkinter
 import struct
 import time
 import sys
 import pprint
 import pickle
+import cPickle
+import gzip
+import os
 import numpy as np
 # from PIL import ImageTk         
 # from PIL import Image
 
 
 
+## Tkinter and pylab (and with it all of matplotlib) are slow to import
+## and only needed to draw, so they are left out until a run asks for
+## graphics; see loadGraphics
+Tkinter = None
+pylab = None
+
+def loadGraphics():
+    """Import the modules the interactive display and end-of-run graphs need."""
+    global Tkinter, pylab
+    import Tkinter
+    import pylab
+
+
 class Sim:
     """Instantiates a single run of the simulation."""    
     def __init__ (self, params):
@@ -45,6 +69,10 @@ class Sim:
         self.pyramid = PopPyramid(self.p['num5YearAgeClasses'],
                                   self.p['numCareLevels'])
         self.textUpdateList = []
+        self.instruments = Instruments(self.p['instrumentReport'] is not None)
+
+        if self.p['interactiveGraphics'] or self.p['singleRunGraphs']:
+            loadGraphics()
 
         if self.p['interactiveGraphics']:
             self.window = Tkinter.Tk()
@@ -54,23 +82,60 @@ class Sim:
                                     background=self.p['bgColour'])
 
 
-    def run(self):
-        """Run the simulation from year start to year end."""
+    def run(self, seed = None):
+        """
+        Run the simulation from year start to year end. seed is the key
+        (see seeds.py) to seed the random number generators from; by
+        default it is p['favouriteSeed'], or a fresh one if that is None.
+        The key is returned with the result, and running again with the
+        same key and parameters replays the run exactly.
+        """
+        self.start(seed)
+        self.runUntil(self.p['endYear'])
+        return self.finish()
+
+
+    def start(self, seed = None):
+        """Seed the random number generators and set up the map and population."""
 
         #pprint.pprint(self.p)
         #raw_input("Happy with these parameters?  Press enter to run.")
 
-        seed = time.time()
-        random.seed(seed)
+        if seed is None:
+            if self.p['favouriteSeed'] is None:
+                seed = seedKey(newMasterSeed())
+            else:
+                seed = seedKey(self.p['favouriteSeed'])
+        self.seed = seed
+        ## The array engine draws its batched random numbers from self.rng
+        self.rng = seedGenerators(seed)
 
         self.initializePop()
         if self.p['interactiveGraphics']:
             self.initializeCanvas()        
-        for self.year in range (self.p['startYear'],
-                                self.p['endYear']+1):
+        self.nextYear = self.p['startYear']
+
+
+    def runUntil(self, lastYear):
+        """Simulate each year from where the run has got to up to lastYear."""
+        for self.year in range (self.nextYear, lastYear+1):
             self.doOneYear()
             #if self.year == self.p['thePresent']:
             #    random.seed()
+            self.nextYear = self.year + 1
+            every = self.p['checkpointEvery']
+            if every > 0 and (self.year - self.p['startYear'] + 1) % every == 0:
+                self.checkpoint(self.p['checkpointFile'])
+
+
+    def finish(self):
+        """
+        Write the instrumentation report, if asked for, show the
+        end-of-run graphs, and return the final tax burden and the seed key.
+        """
+        if self.p['instrumentReport'] is not None:
+            path = self.p['instrumentReport'].replace('{seed}', self.seed.replace('/', '-'))
+            self.instruments.write(path)
 
         if self.p['singleRunGraphs']:
             self.doGraphs()
@@ -79,7 +144,7 @@ class Sim:
             print "Entering main loop to hold graphics up there."
             self.window.mainloop()
 
-        return self.totalTaxBurden[-1], seed
+        return self.totalTaxBurden[-1], self.seed
 
 
     def initializePop(self):
@@ -105,108 +170,240 @@ class Sim:
         ## Now the people who will live on it
 
         if self.p['loadFromFile'] == False:
-            self.pop = Population(self.p['initialPop'],
-                                  self.p['startYear'],
-                                  self.p['minStartAge'],
-                                  self.p['maxStartAge'])
+            if self.p['engine'] == 'array':
+                popClass = ArrayPopulation
+            else:
+                popClass = Population
+            self.pop = popClass(self.p['initialPop'],
+                                self.p['startYear'],
+                                self.p['minStartAge'],
+                                self.p['maxStartAge'])
             ## Now put the people into some houses
             ## They've already been partnered up so put the men in first, then women to follow
-            men = [x for x in self.pop.allPeople if x.sex == 'male']
+            men = [x for x in self.pop.allPeople if x.sexCode == MALE]
 
             remainingHouses = []
             remainingHouses.extend(self.map.allHouses)
         
             for man in men:
-                man.house = random.choice(remainingHouses)
+                self.pop.setHouse(man, random.choice(remainingHouses))
                 man.sec = man.house.size  ## This may not always work, assumes house classes = SEC classes!
-                self.map.occupiedHouses.append(man.house)            
+                self.map.houseOccupied(man.house)
                 remainingHouses.remove(man.house)
                 woman = man.partner
-                woman.house = man.house
+                self.pop.setHouse(woman, man.house)
                 woman.sec = man.sec
                 man.house.occupants.append(man)
                 man.house.occupants.append(woman)
 
         else:
             self.pop = pickle.load(open("initPop.txt","rb"))
+            self.pop.counters = self.pop.recount()
+            if self.p['engine'] == 'array':
+                self.pop = arrayPopulationFrom(self.pop)
 
         ## Choose one house to be the display house
         self.displayHouse = self.pop.allPeople[0].house
         self.nextDisplayHouse = None
 
+        self.loadTables()
+
+    def loadTables(self):
+        """Load the demographic tables (see tables.py) and work out the care transition table."""
         #reading JH's fertility projections from a CSV into a numpy array
-        self.fert_data = np.genfromtxt('babyrate.txt.csv', skip_header=0, delimiter=',')
+        self.fert_data = loadTable('babyrate.txt.csv')
 
         #reading JH's fertility projections from two CSVs into two numpy arrays
-        self.death_female = np.genfromtxt('deathrate.fem.csv', skip_header=0, delimiter=',')
-        self.death_male = np.genfromtxt('deathrate.male.csv', skip_header=0, delimiter=',')
-        
+        self.death_female = loadTable('deathrate.fem.csv')
+        self.death_male = loadTable('deathrate.male.csv')
+
+        ## Care transition probabilities by sex and age, for the array engine
+        self.careProbByAge = self.careProbTable()
+
+        ## Hours of care needed by care need level, and able to be
+        ## given by status code, for the census
+        self.careDemandInHours = np.asarray(self.p['careDemandInHours'], dtype=float)
+        self.hoursByStatus = np.zeros(len(statusNames))
+        self.hoursByStatus[CHILD] = self.p['childHours']
+        self.hoursByStatus[AT_HOME] = self.p['homeAdultHours']
+        self.hoursByStatus[INDEPENDENT] = self.p['workingAdultHours']
+        self.hoursByStatus[RETIRED] = self.p['retiredHours']
+
+
+    ## Everything in a checkpoint besides the map and population: the
+    ## statistical tallies and the rest of the state carried from year to year
+    checkpointFields = [ 'times', 'pops', 'avgHouseholdSize', 'marriageTally',
+                         'numMarriages', 'divorceTally', 'numDivorces',
+                         'totalCareDemand', 'totalCareSupply', 'numTaxpayers',
+                         'totalUnmetNeed', 'totalFamilyCare', 'totalTaxBurden',
+                         'marriageProp', 'textUpdateList', 'displayHouse',
+                         'nextDisplayHouse', 'seed', 'year', 'nextYear' ]
+
+    ## Bump this whenever the contents of a checkpoint change
+    checkpointVersion = 4
+
+    def checkpoint(self, path):
+        """
+        Save everything needed to carry on the run from the start of
+        the next year: the parameters, map, population, the state of
+        both random number generators, the tallies and textUpdateList.
+        The file is a gzipped pickle, written to one side and then
+        renamed, so a crash mid-write leaves the last checkpoint intact.
+
+        People and houses refer to each other in long chains (parents,
+        children, partners, occupants) that would take pickle far past
+        the recursion limit, so each is pickled separately, with every
+        reference to a person or house stored as its position in
+        allPeople or allHouses.
+        """
+        people = self.pop.allPeople
+        houses = self.map.allHouses
+        positions = {}
+        for i in range(len(people)):
+            positions[id(people[i])] = 'p' + str(i)
+        for i in range(len(houses)):
+            positions[id(houses[i])] = 'h' + str(i)
+
+        state = {}
+        state['format'] = 'lives checkpoint'
+        state['version'] = Sim.checkpointVersion
+        state['params'] = self.p
+        state['map'] = self.map
+        state['pop'] = self.pop
+        state['random'] = random.getstate()
+        state['rng'] = self.rng.get_state()
+        state['personCounter'] = Person.counter
+        for name in Sim.checkpointFields:
+            state[name] = getattr(self, name)
+        state['people'] = [ x.__getstate__() for x in people ]
+        state['houses'] = [ x.__getstate__() for x in houses ]
+
+        temporary = path + '.tmp'
+        outFile = gzip.open(temporary, 'wb')
+        pickler = cPickle.Pickler(outFile, 2)
+        pickler.persistent_id = lambda x: positions.get(id(x))
+        pickler.dump(state)
+        outFile.close()
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temporary, path)
+
+    @staticmethod
+    def fromCheckpoint(path, params = None):
+        """
+        A Sim ready to carry on from a checkpoint. params, if given,
+        replace the saved parameters, e.g. to turn graphics on.
+        """
+        ## People and houses are created empty when first referred to,
+        ## and filled in once everything has been read
+        shells = {}
+        def shell(position):
+            if position not in shells:
+                if position[0] == 'p':
+                    shells[position] = Person.__new__(Person)
+                else:
+                    shells[position] = House.__new__(House)
+            return shells[position]
+
+        inFile = gzip.open(path, 'rb')
+        unpickler = cPickle.Unpickler(inFile)
+        unpickler.persistent_load = shell
+        state = unpickler.load()
+        inFile.close()
+        if state.get('format') != 'lives checkpoint' or state['version'] != Sim.checkpointVersion:
+            print path, "is not a checkpoint this version of the sim can read."
+            sys.exit()
+
+        if params is None:
+            params = state['params']
+        for i in range(len(state['people'])):
+            shell('p' + str(i)).__setstate__(state['people'][i])
+        for i in range(len(state['houses'])):
+            shell('h' + str(i)).__setstate__(state['houses'][i])
+
+        sim = Sim(params)
+        sim.map = state['map']
+        sim.pop = state['pop']
+        for name in Sim.checkpointFields:
+            setattr(sim, name, state[name])
+        random.setstate(state['random'])
+        sim.rng = np.random.RandomState()
+        sim.rng.set_state(state['rng'])
+        Person.counter = state['personCounter']
+
+        sim.loadTables()
+        if sim.p['interactiveGraphics']:
+            sim.initializeCanvas()
+        return sim
+
+    @staticmethod
+    def resume(path, params = None):
+        """Carry on a run from a checkpoint to the end; returns what run() would have."""
+        sim = Sim.fromCheckpoint(path, params)
+        sim.runUntil(sim.p['endYear'])
+        return sim.finish()
 
         
     def doOneYear(self):
         """Run one year of simulated time."""
 
         ##print "Sim Year: ", self.year, "OH count:", len(self.map.occupiedHouses), "H count:", len(self.map.allHouses)
-        self.doDeaths()
-        self.doCareTransitions()
-        self.doAgeTransitions()
-        self.doBirths()
-        self.doDivorces()
-        self.doMarriages()
-        self.doMovingAround()
+        phases = self.instruments
+        phases.startYear(self.year)
+        phases.phase('deaths', self.doDeaths)
+        phases.phase('care', self.doCareTransitions)
+        phases.phase('age', self.doAgeTransitions)
+        phases.phase('births', self.doBirths)
+        phases.phase('divorces', self.doDivorces)
+        phases.phase('marriages', self.doMarriages)
+        phases.phase('moving', self.doMovingAround)
         #print("Number of alive agents: {}".format(len(self.pop.livingPeople)))
-        self.pyramid.update(self.year, self.p['num5YearAgeClasses'], self.p['numCareLevels'],
-                            self.p['pixelsInPopPyramid'], self.pop.livingPeople)
-        self.doStats()
+        phases.phase('pyramid', lambda: self.pyramid.update(self.pyramidColumns,
+                                                           self.p['pixelsInPopPyramid']))
+        phases.phase('stats', self.doStats)
         if (self.p['interactiveGraphics']):
             self.updateCanvas()
         
 
     def doDeaths(self):
         """Consider the possibility of death for each person in the sim."""
-        for person in self.pop.livingPeople:
+        if self.p['engine'] == 'array':
+            self.doDeathsArray()
+            return
+
+        ## Taking each death out of livingPeople while going through it
+        ## means the next person along gets no chance to die that year;
+        ## deathSkipsNextPerson keeps this, as in the calibrated runs
+        skip = self.p['deathSkipsNextPerson']
+        if skip:
+            people = self.pop.livingPeople
+        else:
+            people = list(self.pop.livingPeople)
+        for person in people:
             age = self.year - person.birthdate
             ##use the empirical rates from 1951 onwards
             if self.year > 1950:
                 age = self.year - person.birthdate
                 if age > 109:
                     age = 109
-                if person.sex == 'male':
+                if person.sexCode == MALE:
                     maleDieProb = self.death_male[age, self.year-1950]
                     if random.random() < maleDieProb:
-                        person.dead = True
-                        self.pop.livingPeople.remove(person)
-                        person.house.occupants.remove(person)
-                        if len(person.house.occupants) == 0:
-                            self.map.occupiedHouses.remove(person.house)
-                            if (self.p['interactiveGraphics']):
-                                self.canvas.itemconfig(person.house.icon, state='hidden')
-                        if person.partner != None:
-                            person.partner.partner = None
-                        if person.house == self.displayHouse:
-                            messageString = str(self.year) + ": #" + str(person.id) + " died aged " + str(age) + "." 
-                            self.textUpdateList.append(messageString)
-                if person.sex == 'female':
+                        if skip:
+                            self.pop.livingPeople.remove(person)
+                        self.personDies(person, age)
+                if person.sexCode == FEMALE:
                     femaleDieProb = self.death_female[age, self.year-1950]
                     if random.random() < femaleDieProb:
-                        person.dead = True
-                        self.pop.livingPeople.remove(person)
-                        person.house.occupants.remove(person)
-                        if len(person.house.occupants) == 0:
-                            self.map.occupiedHouses.remove(person.house)
-                            if (self.p['interactiveGraphics']):
-                                self.canvas.itemconfig(person.house.icon, state='hidden')
-                        if person.partner != None:
-                            person.partner.partner = None
-                        if person.house == self.displayHouse:
-                            messageString = str(self.year) + ": #" + str(person.id) + " died aged " + str(age) + "." 
-                            self.textUpdateList.append(messageString)    
-        ##use made-up rates prior to 1951
-        else:
+                        if skip:
+                            self.pop.livingPeople.remove(person)
+                        self.personDies(person, age)
+            ##use made-up rates prior to 1951 (switched off in the calibrated runs)
+            elif self.p['preEmpiricalMortality']:
                 babyDieProb = 0.0
                 if age < 1:
                     babyDieProb = self.p['babyDieProb']
-                if person.sex == 'male':
+                if person.sexCode == MALE:
                     ageDieProb = ( ( math.exp( age /
                                                self.p['maleAgeScaling'] ) )
                                    * self.p['maleAgeDieProb'] )
@@ -215,17 +412,86 @@ class Sim:
                                                self.p['femaleAgeScaling'] ) )
                                    * self.p['femaleAgeDieProb'] )
                 dieProb = self.p['baseDieProb'] + babyDieProb + ageDieProb
+                if random.random() < dieProb:
+                    if skip:
+                        self.pop.livingPeople.remove(person)
+                    self.personDies(person, age)
                     
                 
         ## Can't remove from list while iterating so we need this
         self.pop.livingPeople[:] = [x for x in self.pop.livingPeople if x.dead == False]                
 
+    def doDeathsArray(self):
+        """
+        The array engine's version of doDeaths. Every living person's
+        probability of dying is looked up in one go, all the draws are
+        made at once, and livingPeople is rebuilt once at the end
+        rather than having each death removed from it. With
+        deathSkipsNextPerson, the deaths of anyone straight after a
+        death are then undone, which is what the plain loop's removals
+        amount to; the two engines' mortality is otherwise the same.
+        """
+        pop = self.pop
+        living = pop.living()
+        age = self.year - pop.birthdate[living]
+        male = pop.sex[living] == MALE
+
+        if self.year > 1950:
+            ##use the empirical rates from 1951 onwards
+            age = np.minimum(age, 109)
+            dieProb = np.where(male,
+                               self.death_male[age, self.year-1950],
+                               self.death_female[age, self.year-1950])
+        elif self.p['preEmpiricalMortality']:
+            ##use made-up rates prior to 1951
+            ageDieProb = np.where(male,
+                                  np.exp(age / self.p['maleAgeScaling']) * self.p['maleAgeDieProb'],
+                                  np.exp(age / self.p['femaleAgeScaling']) * self.p['femaleAgeDieProb'])
+            dieProb = self.p['baseDieProb'] + np.where(age < 1, self.p['babyDieProb'], 0.0) + ageDieProb
+        else:
+            return
+
+        dies = self.rng.random_sample(len(living)) < dieProb
+        if self.p['deathSkipsNextPerson']:
+            ## As in doDeaths, whoever comes straight after a death in
+            ## livingPeople isn't given the chance to die this year
+            previous = -2
+            for k in np.flatnonzero(dies):
+                if k == previous + 1:
+                    dies[k] = False
+                else:
+                    previous = k
+        if not dies.any():
+            return
+        for i, a in zip(living[dies], age[dies]):
+            self.personDies(pop.allPeople[i], a)
+        pop.livingPeople = [pop.allPeople[i] for i in living[~dies]]
+
+    def personDies(self, person, age):
+        """Take a newly dead person out of their household and partnership."""
+        self.pop.markDead(person)
+
+        person.house.occupants.remove(person)
+        if len(person.house.occupants) == 0:
+            self.map.houseVacated(person.house)
+            if (self.p['interactiveGraphics']):
+                self.canvas.itemconfig(person.house.icon, state='hidden')
+        if person.partner != None:
+            self.pop.clearPartner(person.partner)
+        if person.house == self.displayHouse:
+            messageString = str(self.year) + ": #" + str(person.id) + " died aged " + str(age) + "." 
+            self.textUpdateList.append(messageString)
+
     def doCareTransitions(self):
         """Consider the possibility of each person coming to require care."""
+        if self.p['engine'] == 'array':
+            self.doCareTransitionsArray()
+            return
+
         peopleNotInCriticalCare = [x for x in self.pop.livingPeople if x.careNeedLevel < self.p['numCareLevels']-1]
         for person in peopleNotInCriticalCare:
             age = self.year - person.birthdate
-            if person.sex == 'male':
+            if person.sexCode == MALE:
                 ageCareProb = ( ( math.exp( age /
                                             self.p['maleAgeCareScaling'] ) )
                                * self.p['personCareProb'] )
@@ -238,83 +504,179 @@ class Sim:
             if random.random() < careProb:
                 multiStepTransition = random.random()
                 if multiStepTransition < self.p['cdfCareTransition'][0]:
-                    person.careNeedLevel += 1
+                    newLevel = person.careNeedLevel + 1
                 elif multiStepTransition < self.p['cdfCareTransition'][1]:
-                    person.careNeedLevel += 2
+                    newLevel = person.careNeedLevel + 2
                 elif multiStepTransition < self.p['cdfCareTransition'][2]:
-                    person.careNeedLevel += 3
+                    newLevel = person.careNeedLevel + 3
                 else:
-                    person.careNeedLevel += 4
-                if person.careNeedLevel >= self.p['numCareLevels']:
-                    person.careNeedLevel = self.p['numCareLevels'] - 1
+                    newLevel = person.careNeedLevel + 4
+                if newLevel >= self.p['numCareLevels']:
+                    newLevel = self.p['numCareLevels'] - 1
+                self.pop.setCareNeedLevel(person, newLevel)
                             
                 if person.house == self.displayHouse:
                     messageString = str(self.year) + ": #" + str(person.id) + " now has "
                     messageString += self.p['careLevelNames'][person.careNeedLevel] + " care needs." 
                     self.textUpdateList.append(messageString)
 
+    def careProbTable(self):
+        """
+        The yearly probability of a transition in care need, indexed by
+        [sex code, age], for every age anybody can reach in this run.
+        """
+        maxAge = self.p['endYear'] - self.p['startYear'] + self.p['maxStartAge']
+        ages = np.arange(maxAge + 1)
+        table = np.empty((2, maxAge + 1))
+        table[MALE] = np.exp(ages / self.p['maleAgeCareScaling'])
+        table[FEMALE] = np.exp(ages / self.p['femaleAgeCareScaling'])
+        return self.p['baseCareProb'] + table * self.p['personCareProb']
+
+    def doCareTransitionsArray(self):
+        """
+        The array engine's version of doCareTransitions: probabilities
+        come from the precomputed table, and both the transition draws
+        and the size of each jump in care need are made all at once.
+        """
+        pop = self.pop
+        living = pop.living()
+        topLevel = self.p['numCareLevels'] - 1
+        peopleNotInCriticalCare = living[pop.careNeedLevel[living] < topLevel]
+        age = self.year - pop.birthdate[peopleNotInCriticalCare]
+        careProb = self.careProbByAge[pop.sex[peopleNotInCriticalCare], age]
+
+        draws = self.rng.random_sample(len(peopleNotInCriticalCare))
+        transitions = peopleNotInCriticalCare[draws < careProb]
+        if len(transitions) == 0:
+            return
+        multiStepTransition = self.rng.random_sample(len(transitions))
+        steps = np.searchsorted(self.p['cdfCareTransition'], multiStepTransition, side='right') + 1
+        newLevels = np.minimum(pop.careNeedLevel[transitions] + steps, topLevel)
+
+        for i, newLevel in zip(transitions, newLevels):
+            person = pop.allPeople[i]
+            self.pop.setCareNeedLevel(person, int(newLevel))
+            if person.house == self.displayHouse:
+                messageString = str(self.year) + ": #" + str(person.id) + " now has "
+                messageString += self.p['careLevelNames'][person.careNeedLevel] + " care needs." 
+                self.textUpdateList.append(messageString)
+
     def doAgeTransitions(self):
         """Check whether people have moved on to a new status in life."""
-        peopleNotYetRetired = [x for x in self.pop.livingPeople if x.status != 'retired']
+        if self.p['engine'] == 'array':
+            self.doAgeTransitionsArray()
+            return
+
+        peopleNotYetRetired = [x for x in self.pop.livingPeople if x.statusCode != RETIRED]
         for person in peopleNotYetRetired:
             age = self.year - person.birthdate
             ## Do transitions to adulthood and retirement
             if age == self.p['ageOfAdulthood']:
-                person.status = 'adult at home'
-                if person.house == self.displayHouse:
-                    self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + " is now an adult.")
+                self.comeOfAge(person)
             elif age == self.p['ageOfRetirement']:
-                person.status = 'retired'
-                if person.house == self.displayHouse:
-                    self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + " has now retired.")
+                self.retire(person)
 
             ## If somebody is still at home but their parents have died, promote them to independent adult
-            if person.status == 'adult at home' and person.mother.dead and person.father.dead:
-                person.status = 'independent adult'
-                if person.house == self.displayHouse:
-                    self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + "'s parents are both dead.")
+            if person.statusCode == AT_HOME and person.mother.dead and person.father.dead:
+                self.leaveOrphanedHome(person)
                     
             ## If somebody is a *child* at home and their parents have died, they need to be adopted
-            if person.status == 'child' and person.mother.dead and person.father.dead:
-                if person.house == self.displayHouse:
-                    self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + "will now be adopted.")
-
-                while True:
-                    adoptiveMother = random.choice(self.pop.livingPeople)
-                    if ( adoptiveMother.status != 'child'
-                         and adoptiveMother.sex == 'female'
-                         and adoptiveMother.partner != None ):
-                        break
-
-                person.mother = adoptiveMother
-                adoptiveMother.children.append(person)
-                person.father = adoptiveMother.partner
-                adoptiveMother.partner.children.append(person)                
-
-                if adoptiveMother.house == self.displayHouse:
-                    self.textUpdateList.append(str(self.year) + ": #" + str(person.id) +
-                                               " has been newly adopted by " + str(adoptiveMother.id)
-                                               + "." )
-                self.movePeopleIntoChosenHouse(adoptiveMother.house,person.house,[person])         
+            if person.statusCode == CHILD and person.mother.dead and person.father.dead:
+                self.adopt(person)
+
+    def doAgeTransitionsArray(self):
+        """
+        The array engine's version of doAgeTransitions. Everyone
+        reaching the age of adulthood or retirement this year is found
+        from the birthdate column, and the orphans still at home by
+        looking up their parents' dead flags, all at once; only the
+        people found are then dealt with one by one, in the same order
+        as the plain version would.
+        """
+        pop = self.pop
+        living = pop.living()
+        status = pop.status[living]
+        age = self.year - pop.birthdate[living]
+
+        notRetired = status != RETIRED
+        comingOfAge = notRetired & (age == self.p['ageOfAdulthood'])
+        retiring = notRetired & ~comingOfAge & (age == self.p['ageOfRetirement'])
+        status = np.where(comingOfAge, AT_HOME, np.where(retiring, RETIRED, status))
+
+        ## Only children and adults at home are checked for orphans, and
+        ## they always have both parents
+        atHome = notRetired & ((status == AT_HOME) | (status == CHILD))
+        mother = pop.mother[living]
+        father = pop.father[living]
+        orphaned = np.zeros(len(living), dtype=bool)
+        orphaned[atHome] = pop.dead[mother[atHome]] & pop.dead[father[atHome]]
+        orphanedAdult = orphaned & (status == AT_HOME)
+        orphanedChild = orphaned & (status == CHILD)
+
+        for i in np.flatnonzero(comingOfAge | retiring | orphaned):
+            person = pop.allPeople[living[i]]
+            if comingOfAge[i]:
+                self.comeOfAge(person)
+            elif retiring[i]:
+                self.retire(person)
+            if orphanedAdult[i]:
+                self.leaveOrphanedHome(person)
+            if orphanedChild[i]:
+                self.adopt(person)
+
+    def comeOfAge(self, person):
+        self.pop.setStatus(person, AT_HOME)
+        if person.house == self.displayHouse:
+            self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + " is now an adult.")
+
+    def retire(self, person):
+        self.pop.setStatus(person, RETIRED)
+        if person.house == self.displayHouse:
+            self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + " has now retired.")
+
+    def leaveOrphanedHome(self, person):
+        """An adult at home whose parents have both died becomes an independent adult."""
+        self.pop.setStatus(person, INDEPENDENT)
+        if person.house == self.displayHouse:
+            self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + "'s parents are both dead.")
+
+    def adopt(self, person):
+        """A child whose parents have both died is adopted by a random woman with a partner."""
+        if person.house == self.displayHouse:
+            self.textUpdateList.append(str(self.year) + ": #" + str(person.id) + "will now be adopted.")
+
+        while True:
+            adoptiveMother = random.choice(self.pop.livingPeople)
+            if ( adoptiveMother.statusCode != CHILD
+                 and adoptiveMother.sexCode == FEMALE
+                 and adoptiveMother.partner != None ):
+                break
+
+        self.pop.setParents(person, adoptiveMother, adoptiveMother.partner)
+        adoptiveMother.children.append(person)
+        adoptiveMother.partner.children.append(person)                
+
+        if adoptiveMother.house == self.displayHouse:
+            self.textUpdateList.append(str(self.year) + ": #" + str(person.id) +
+                                       " has been newly adopted by " + str(adoptiveMother.id)
+                                       + "." )
+        self.movePeopleIntoChosenHouse(adoptiveMother.house,person.house,[person])         
 
     def doBirths(self):
         """For each fertile woman check whether she gives birth."""
 
-        marriedLadies = 0
-        adultLadies = 0
+        if self.p['engine'] == 'array':
+            self.doBirthsArray()
+            return
 
         womenOfReproductiveAge = [x for x in self.pop.livingPeople
-                                  if x.sex == 'female'
+                                  if x.sexCode == FEMALE
                                   and (self.year - x.birthdate) > self.p['minPregnancyAge']
                                   and (self.year - x.birthdate) < self.p['maxPregnancyAge']
                                   and x.partner != None ]
-        #counting up marriage stats
-        for person in self.pop.livingPeople:
-            age = self.year - person.birthdate
-            if person.sex == 'female' and age >=17:
-                adultLadies += 1
-                if person.partner != None:
-                    marriedLadies += 1
+        #marriage stats come from the population counters
+        adultLadies = self.pop.counters.women(self.year, 17)
+        marriedLadies = self.pop.counters.marriedWomen(self.year, 17)
 
         #printing out stats for troubleshooting and sanity check
         marriedPercentage = float(marriedLadies)/float(adultLadies)
@@ -332,19 +694,55 @@ class Sim:
                     birthProb = (self.fert_data[(self.year - woman.birthdate)-16,self.year-1950])/marriedPercentage
                     ##print "Birth probability is: ", birthProb
                 if random.random() < birthProb:
-                    baby = Person(woman, woman.partner, self.year, 'random', woman.house, woman.sec )
-                    self.pop.allPeople.append(baby)
-                    self.pop.livingPeople.append(baby)
-                    woman.house.occupants.append(baby)
-                    woman.children.append(baby)
-                    woman.partner.children.append(baby)
-                    if woman.house == self.displayHouse:
-                        messageString = str(self.year) + ": #" + str(woman.id) + " had a baby, #" + str(baby.id) + "." 
-                        self.textUpdateList.append(messageString) 
+                    self.giveBirth(woman)
+
+    def doBirthsArray(self):
+        """
+        The array engine's version of doBirths: the choice of fertile
+        women and their birth draws are done on the population columns
+        at once.
+        """
+        pop = self.pop
+        living = pop.living()
+        age = self.year - pop.birthdate[living]
+        female = pop.sex[living] == FEMALE
+        married = pop.partner[living] >= 0
+
+        adultLadies = pop.counters.women(self.year, 17)
+        marriedLadies = pop.counters.marriedWomen(self.year, 17)
+        marriedPercentage = float(marriedLadies)/float(adultLadies)
+
+        fertile = ( female & married
+                    & (age > self.p['minPregnancyAge'])
+                    & (age < self.p['maxPregnancyAge']) )
+        womenOfReproductiveAge = living[fertile]
+        if self.year < 1951:
+            birthProb = self.p['growingPopBirthProb']
+        else:
+            birthProb = self.fert_data[age[fertile]-16, self.year-1950] / marriedPercentage
+
+        draws = self.rng.random_sample(len(womenOfReproductiveAge))
+        for i in womenOfReproductiveAge[draws < birthProb]:
+            self.giveBirth(pop.allPeople[i])
+
+    def giveBirth(self, woman):
+        """A woman and her partner have a baby, who joins her household."""
+        baby = Person(woman, woman.partner, self.year, 'random', woman.house, woman.sec )
+        self.pop.addPerson(baby)
+        woman.house.occupants.append(baby)
+        woman.children.append(baby)
+        woman.partner.children.append(baby)
+        if woman.house == self.displayHouse:
+            messageString = str(self.year) + ": #" + str(woman.id) + " had a baby, #" + str(baby.id) + "." 
+            self.textUpdateList.append(messageString) 
 
 
     def doDivorces(self):
-        menInRelationships = [x for x in self.pop.livingPeople if x.sex == 'male' and x.partner != None ]
+        if self.p['engine'] == 'array':
+            self.doDivorcesArray()
+            return
+
+        menInRelationships = [x for x in self.pop.livingPeople if x.sexCode == MALE and x.partner != None ]
         for man in menInRelationships:
             age = self.year - man.birthdate 
 
@@ -356,15 +754,37 @@ class Sim:
                 splitProb = self.p['variableDivorce'] * self.p['divorceModifierByDecade'][age/10]
                 
             if random.random() < splitProb:
-                wife = man.partner
-                man.partner = None
-                wife.partner = None
-                self.divorceTally += 1
-                distance = random.choice(['near','far'])
-                if man.house == self.displayHouse:
-                    messageString = str(self.year) + ": #" + str(man.id) + " splits with #" + str(wife.id) + "."
-                    self.textUpdateList.append(messageString)
-                self.findNewHouse([man],distance)
+                self.splitCouple(man)
+
+    def doDivorcesArray(self):
+        """The array engine's version of doDivorces, drawing for all couples at once."""
+        pop = self.pop
+        living = pop.living()
+        menInRelationships = living[ (pop.sex[living] == MALE)
+                                     & (pop.partner[living] >= 0) ]
+        age = self.year - pop.birthdate[menInRelationships]
+
+        if self.year < self.p['thePresent']:
+            divorceRate = self.p['basicDivorceRate']
+        else:
+            divorceRate = self.p['variableDivorce']
+        splitProb = divorceRate * np.asarray(self.p['divorceModifierByDecade'])[age // 10]
+
+        draws = self.rng.random_sample(len(menInRelationships))
+        for i in menInRelationships[draws < splitProb]:
+            self.splitCouple(pop.allPeople[i])
+
+    def splitCouple(self, man):
+        """A man splits with his partner and moves out."""
+        wife = man.partner
+        self.pop.clearPartner(man)
+        self.pop.clearPartner(wife)
+        self.divorceTally += 1
+        distance = random.choice(['near','far'])
+        if man.house == self.displayHouse:
+            messageString = str(self.year) + ": #" + str(man.id) + " splits with #" + str(wife.id) + "."
+            self.textUpdateList.append(messageString)
+        self.findNewHouse([man],distance)
                 
 
     def doMarriages(self):
@@ -380,8 +800,8 @@ class Sim:
         eligibleWomen = []
 
         for i in self.pop.livingPeople:
-            if i.status != 'child' and i.partner == None:
-                if i.sex == 'male':
+            if i.statusCode != CHILD and i.partner == None:
+                if i.sexCode == MALE:
                     eligibleMen.append(i)
                 else:
                     eligibleWomen.append(i)
@@ -391,7 +811,7 @@ class Sim:
             random.shuffle(eligibleMen)
             random.shuffle(eligibleWomen)
 
-            interestedWomen = []
+            interestedWomen = MarriageMarket()
             for w in eligibleWomen:
                 womanAge = self.year - w.birthdate
                 womanMarriageProb = ( self.p['basicFemaleMarriageProb']
@@ -404,25 +824,18 @@ class Sim:
                 manMarriageProb = ( self.p['basicMaleMarriageProb']
                                     * self.p['maleMarriageModifierByDecade'][manAge/10] )
                 if ( random.random() < manMarriageProb ):
-                    for w in interestedWomen:
+                    w = interestedWomen.takeFirstMatch(m)
+                    if w != None:
                         womanAge = self.year - w.birthdate
-                        diff = manAge - womanAge
-                        if ( diff < 20 and diff > -5
-                             and m.mother != w.mother ):
-                            m.partner = w
-                            w.partner = m
-                            interestedWomen.remove(w)
-                            self.marriageTally += 1
-                            if m.house == self.displayHouse or w.house == self.displayHouse:
-                                messageString = str(self.year) + ": #" + str(m.id) + " (age " + str(manAge) + ")"
-                                messageString += " and #" + str(w.id) + " (age " + str(womanAge)
-                                messageString += ") marry."
-                                self.textUpdateList.append(messageString)
-                            break
-                            
-                    
-                
-            
+                        self.pop.setPartners(m, w)
+                        self.marriageTally += 1
+                        if m.house == self.displayHouse or w.house == self.displayHouse:
+                            messageString = str(self.year) + ": #" + str(m.id) + " (age " + str(manAge) + ")"
+                            messageString += " and #" + str(w.id) + " (age " + str(womanAge)
+                            messageString += ") marry."
+                            self.textUpdateList.append(messageString)
+
+            self.instruments.count('marriageCandidatesScanned', interestedWomen.scanned)
 
 
     def doMovingAround(self):
@@ -477,12 +890,12 @@ class Sim:
                             self.textUpdateList.append(messageString)
                         self.findNewHouse(peopleToMove,distance)                        
 
-                    if person.status == 'adult at home':
-                        person.status = 'independent adult'
-                    if person.partner.status == 'adult at home':
-                        person.partner.status = 'independent adult'
+                    if person.statusCode == AT_HOME:
+                        self.pop.setStatus(person, INDEPENDENT)
+                    if person.partner.statusCode == AT_HOME:
+                        self.pop.setStatus(person.partner, INDEPENDENT)
 
-            elif ( person.status == 'adult at home'
+            elif ( person.statusCode == AT_HOME
                    and person.partner == None ):
                 ## a single person who hasn't left home yet
                 if random.random() < ( self.p['basicProbAdultMoveOut']
@@ -494,10 +907,10 @@ class Sim:
                         messageString = str(self.year) + ": #" + str(person.id) + " moves out, aged " + str(self.year-person.birthdate) + "."
                         self.textUpdateList.append(messageString)
                     self.findNewHouse(peopleToMove,distance)
-                    person.status = 'independent adult'
+                    self.pop.setStatus(person, INDEPENDENT)
                     
 
-            elif ( person.status == 'independent adult'
+            elif ( person.statusCode == INDEPENDENT
                    and person.partner == None ):
                 ## a young-ish person who has left home but is still (or newly) single
                 if random.random() < ( self.p['basicProbSingleMove']
@@ -510,12 +923,12 @@ class Sim:
                         self.textUpdateList.append(messageString)
                     self.findNewHouse(peopleToMove,distance)
 
-            elif ( person.status == 'retired'
+            elif ( person.statusCode == RETIRED
                    and len(person.house.occupants) == 1 ):
                 ## a retired person who lives alone
                 for c in person.children:
                     if ( c.dead == False ):
-                        distance = self.manhattanDistance(person.house.town,c.house.town)
+                        distance = self.map.townDistance[person.house.town.index, c.house.town.index]
                         distance += 1.0
                         if self.year < self.p['thePresent']:
                             mbRate = self.p['agingParentsMoveInWithKids'] / distance
@@ -551,9 +964,7 @@ class Sim:
 
     def manhattanDistance(self,t1,t2):
         """Calculates the distance between two towns"""
-        xDist = abs(t1.x - t2.x)
-        yDist = abs(t1.y - t2.y)
-        return xDist + yDist
+        return self.map.townDistance[t1.index, t2.index]
 
 
     def bringTheKids(self,person):
@@ -561,7 +972,7 @@ class Sim:
         returnList = []
         for i in person.children:
             if ( i.house == person.house
-                 and i.status == 'child'
+                 and i.statusCode == CHILD
                  and i.dead == False ):
                 returnList.append(i)
         return returnList
@@ -577,35 +988,23 @@ class Sim:
 
         if ( preference == 'here' ):
             ## Anything empty in this town of the right size?
-            localPossibilities = [x for x in t.houses
-                                  if len(x.occupants) < 1
-                                  and person.sec == x.size ]
-            if localPossibilities:
-                newHouse = random.choice(localPossibilities)
+            newHouse = self.map.randomEmptyHouse(person.sec, [t])
+            if newHouse != None:
+                self.instruments.count('houseFoundHere')
 
         if ( preference == 'near' or newHouse == None ):
             ## Neighbouring towns?
             if newHouse == None:
-                nearbyTowns = [ k for k in self.map.towns
-                                if abs(k.x - t.x) <= 1
-                                and abs(k.y - t.y) <= 1 ]
-                nearbyPossibilities = []
-                for z in nearbyTowns:
-                    for w in z.houses:
-                        if len(w.occupants) < 1 and person.sec == w.size:
-                            nearbyPossibilities.append(w)
-                if nearbyPossibilities:
-                    newHouse = random.choice(nearbyPossibilities)
+                newHouse = self.map.randomEmptyHouse(person.sec, self.map.neighbours[t.index])
+                if newHouse != None:
+                    self.instruments.count('houseFoundNear')
 
         if ( preference == 'far' or newHouse == None ):
             ## Anywhere at all?
             if newHouse == None:
-                allPossibilities = []
-                for z in self.map.allHouses:
-                    if len(z.occupants) < 1 and person.sec == z.size:
-                        allPossibilities.append(z)
-                if allPossibilities:
-                    newHouse = random.choice(allPossibilities)
+                newHouse = self.map.randomEmptyHouse(person.sec)
+                if newHouse != None:
+                    self.instruments.count('houseFoundFar')
 
         ## Quit with an error message if we've run out of houses
         if newHouse == None:
@@ -618,28 +1017,26 @@ class Sim:
 
     def movePeopleIntoChosenHouse(self,newHouse,departureHouse,personList):
 
-        ## Put the new house onto the list of occupied houses if it was empty
-        
+        self.instruments.count('moves')
+        self.instruments.count('peopleMoved', len(personList))
+
         ## Move everyone on the list over from their former house to the new one
         for i in personList:
             oldHouse = i.house
             oldHouse.occupants.remove(i)
             if len(oldHouse.occupants) ==  0:
-                self.map.occupiedHouses.remove(oldHouse)
+                self.map.houseVacated(oldHouse)
                 ##print "This house is now empty: ", oldHouse
                 if (self.p['interactiveGraphics']):
                     self.canvas.itemconfig(oldHouse.icon, state='hidden')
 
             newHouse.occupants.append(i)
-            i.house = newHouse
+            self.pop.setHouse(i, newHouse)
             i.movedThisYear = True
 
-        ## This next is sloppy and will lead to loads of duplicates in the
-        ## occupiedHouses list, but we don't want to miss any -- that's
-        ## much worse -- and the problem will be solved by a conversion
-        ## to set and back to list int he stats method in a moment
-
-        self.map.occupiedHouses.append(newHouse)
+        ## The new house may well have been occupied already, in which
+        ## case this does nothing
+        self.map.houseOccupied(newHouse)
         if (self.p['interactiveGraphics']):
             self.canvas.itemconfig(newHouse.icon, state='normal')
 
@@ -662,22 +1059,13 @@ class Sim:
     def doStats(self):
         """Calculate annual stats and store them appropriately."""
 
+        self.census = self.takeCensus(self.year)
+
         self.times.append(self.year)
 
-        currentPop = len(self.pop.livingPeople)
+        currentPop = self.pop.counters.living
         self.pops.append(currentPop)
 
-        ## Check for double-included houses by converting to a set and back again
-        self.map.occupiedHouses = list(set(self.map.occupiedHouses))
-
-
-        ## Check for overlooked empty houses
-        emptyHouses = [x for x in self.map.occupiedHouses if len(x.occupants) == 0]
-        for h in emptyHouses:
-            self.map.occupiedHouses.remove(h)
-            if (self.p['interactiveGraphics']):
-                self.canvas.itemconfig(h.icon, state='hidden')
-
         ## Avg household size (easily calculated by pop / occupied houses)
         households = len(self.map.occupiedHouses)
         self.avgHouseholdSize.append( 1.0 * currentPop / households )
@@ -687,46 +1075,153 @@ class Sim:
         self.numDivorces.append(self.divorceTally)            
         self.divorceTally = 0
 
-        ## Care demand calculations: first, what's the basic demand and theoretical supply?
-        totalCareDemandHours = 0
-        totalCareSupplyHours = 0
-        taxPayers = 0
-        for person in self.pop.livingPeople:
-            need = self.p['careDemandInHours'][person.careNeedLevel]
-            person.careRequired = need
-            totalCareDemandHours += need
-
-            if person.status == 'child':
-                supply = self.p['childHours']
-            elif person.status == 'adult at home':
-                supply = self.p['homeAdultHours']
-                taxPayers += 1
-            elif person.status == 'independent adult':
-                supply = self.p['workingAdultHours']
-                taxPayers += 1
-            elif person.status == 'retired':
-                supply = self.p['retiredHours']
-            else:
-                print "Shouldn't happen."
-                sys.exit()
-
-            if person.careNeedLevel > 1:
-                supply = 0.0
-            elif person.careNeedLevel == 1:
-                supply *= self.p['lowCareHandicap']
+        ## Demand for and supply of care come from the census; then work out who gets care from whom
+        totalCareDemandHours = self.census.careDemand
+        totalCareSupplyHours = self.census.careSupply
+        taxPayers = self.pop.counters.taxPayers()
+        if self.p['engine'] == 'array':
+            unmetNeed = self.allocateCareArray(self.census)
+        else:
+            unmetNeed = self.allocateCare()
 
-            person.careAvailable = supply
-            totalCareSupplyHours += supply
-        
         self.totalCareDemand.append(totalCareDemandHours)
         self.totalCareSupply.append(totalCareSupplyHours)
         self.numTaxpayers.append(taxPayers)
+        self.totalUnmetNeed.append(unmetNeed)
+
+        if totalCareDemandHours == 0:
+            familyCareRatio = 0.0
+        else:
+            familyCareRatio = ( totalCareDemandHours - unmetNeed ) / (1.0 * totalCareDemandHours)
+
+        ##familyCareRatio = ( totalCareDemandHours - unmetNeed ) / (1.0 * (totalCareDemandHours+0.01))
+        self.totalFamilyCare.append(familyCareRatio)
 
+        taxBurden = ( unmetNeed * self.p['hourlyCostOfCare'] * 52.18 ) / ( taxPayers * 1.0 )
+        self.totalTaxBurden.append(taxBurden)
+
+        ## The proportion of adult women who are married
+        marriagePropNow = ( float(self.pop.counters.marriedWomen(self.year, 18))
+                            / float(self.pop.counters.women(self.year, 18)) )
+        self.marriageProp.append(marriagePropNow)
+
+        ## Some extra debugging stuff just to check that the counters
+        ## and the lists are behaving themselves
+        if self.p['verboseDebugging']:
+            self.checkCounters()
+
+            tally = [ 0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
+            for h in self.map.occupiedHouses:
+                tally[len(h.occupants)] += 1
+            for i in range(len(tally)):
+                if tally[i] > 0:
+                    print i, tally[i]
+            print
+
+    def checkCounters(self):
+        """
+        Recount the population from scratch, from the allPeople list
+        and from the houses, and stop if the running counters disagree.
+        """
+        problems = self.pop.counters.differences(self.pop.recount())
+
+        peopleCount = len([ x for x in self.pop.allPeople if x.dead == False ])
+        if peopleCount != self.pop.counters.living:
+            problems.append("non-dead people in allPeople = " + str(peopleCount))
+        peopleCount = sum([ len(h.occupants) for h in self.map.occupiedHouses ])
+        if peopleCount != self.pop.counters.living:
+            problems.append("occupants of all occupied houses = " + str(peopleCount))
+        peopleCount = sum([ len(h.occupants) for h in self.map.allHouses ])
+        if peopleCount != self.pop.counters.living:
+            problems.append("occupants of ALL houses = " + str(peopleCount))
+
+        if len(problems) > 0:
+            print "Population counters don't match a recount in", self.year
+            for problem in problems:
+                print "   ", problem
+            sys.exit()
+                
+    def takeCensus(self, year):
+        """
+        Gather everything the year's statistics need in one pass over
+        the living: care demand and supply (also setting each person's
+        careRequired and careAvailable). Head counts are kept by the
+        population's counters instead.
+        """
+        if self.p['engine'] == 'array':
+            return self.takeCensusArray(year)
+
+        census = Census()
+        people = self.pop.livingPeople
+        level = np.array([ x.careNeedLevel for x in people ], dtype=int)
+        status = np.array([ x.statusCode for x in people ], dtype=int)
+        need, supply = self.careHours(level, status)
+
+        need = need.tolist()
+        supply = supply.tolist()
+        for i in range(len(people)):
+            people[i].careRequired = need[i]
+            people[i].careAvailable = supply[i]
+        census.careDemand = sum(need)
+        census.careSupply = sum(supply)
+
+        return census
+
+    def careHours(self, level, status):
+        """
+        The hours of care needed and available, for arrays of care need
+        levels and status codes: the availability by status is
+        gathered from hoursByStatus, cut down by a low care need and
+        taken away entirely by anything worse.
+        """
+        need = self.careDemandInHours[level]
+        supply = self.hoursByStatus[status]
+        supply[level == 1] *= self.p['lowCareHandicap']
+        supply[level > 1] = 0.0
+        return need, supply
+
+    def takeCensusArray(self, year):
+        """The array engine's census, as reductions over the population columns."""
+        pop = self.pop
+        census = Census()
+        living = pop.living()
+        need, supply = self.careHours(pop.careNeedLevel[living], pop.status[living])
+
+        census.living = living
+        census.need = need
+        census.supply = supply
+        census.careDemand = sum(need.tolist())
+        census.careSupply = sum(supply.tolist())
+
+        return census
+
+    def pyramidColumns(self):
+        """Age, care need level and femaleness of everyone living, for the pyramid."""
+        if self.p['engine'] == 'array':
+            pop = self.pop
+            living = pop.living()
+            return ( self.year - pop.birthdate[living],
+                     pop.careNeedLevel[living],
+                     pop.sex[living] == FEMALE )
+        people = self.pop.livingPeople
+        return ( np.array([ self.year - x.birthdate for x in people ], dtype=int),
+                 np.array([ x.careNeedLevel for x in people ], dtype=int),
+                 np.array([ x.sexCode == FEMALE for x in people ], dtype=bool) )
+
+    def allocateCare(self):
+        """
+        Starting from the care need and availability the census has
+        set for each person, let people draw care first from their
+        housemates and then from their children in the same town, and
+        return the total unmet need.
+        """
         ## What actually happens to people: do they get the care they need?
+        donorsTried = 0
         for person in self.pop.livingPeople:
             ## Can you get the care you need from your housemates?
             if person.careRequired > 0.000001:
                 for donor in person.house.occupants:
+                    donorsTried += 1
                     if ( person != donor and donor.careAvailable > 0.000001 ):
                         if donor.careAvailable > person.careRequired:
                             swap = person.careRequired
@@ -741,6 +1236,7 @@ class Sim:
             ## Can you get the care you need from your children if they live in the same town?
             if person.careRequired > 0.000001:
                 for donor in person.children:
+                    donorsTried += 1
                     if ( person.house.town == donor.house.town and donor.careAvailable > 0.000001
                          and donor.dead == False ):
                         if donor.careAvailable > person.careRequired:
@@ -753,68 +1249,96 @@ class Sim:
                             donor.careAvailable = 0.0
                             person.careRequired -= swap
 
+        self.instruments.count('careDonorsTried', donorsTried)
+
         ## Now tally up the care situation, how much need is unmet, because that's the state's burden
         unmetNeed = 0.0
         for person in self.pop.livingPeople:
             unmetNeed += person.careRequired
 
-        self.totalUnmetNeed.append(unmetNeed)
+        return unmetNeed
 
-        if totalCareDemandHours == 0:
-            familyCareRatio = 0.0
-        else:
-            familyCareRatio = ( totalCareDemandHours - unmetNeed ) / (1.0 * totalCareDemandHours)
-
-        ##familyCareRatio = ( totalCareDemandHours - unmetNeed ) / (1.0 * (totalCareDemandHours+0.01))
-        self.totalFamilyCare.append(familyCareRatio)
-
-        taxBurden = ( unmetNeed * self.p['hourlyCostOfCare'] * 52.18 ) / ( taxPayers * 1.0 )
-        self.totalTaxBurden.append(taxBurden)
-
-        ## Count the proportion of adult women who are married
-        totalAdultWomen = 0
-        totalMarriedAdultWomen = 0
-
-        for person in self.pop.livingPeople:
-            age = self.year - person.birthdate
-            if person.sex == 'female' and age >= 18:
-                totalAdultWomen += 1
-                if person.partner != None:
-                    totalMarriedAdultWomen += 1
-        marriagePropNow = float(totalMarriedAdultWomen) / float(totalAdultWomen)
-        self.marriageProp.append(marriagePropNow)
-
-        ## Some extra debugging stuff just to check that all
-        ## the lists are behaving themselves
-        if self.p['verboseDebugging']:
-            peopleCount = 0
-            for i in self.pop.allPeople:
-                if i.dead == False:
-                    peopleCount += 1
-            print "True pop counting non-dead people in allPeople list = ", peopleCount
+    def allocateCareArray(self, census):
+        """
+        The array engine's version of allocateCare, starting from the
+        need and supply arrays in the census. Households are laid out
+        as contiguous segments of a house-sorted permutation (CSR-style
+        offsets), so that the greedy allocation only has to visit the
+        people who need care and can skip any household that has no
+        care left to give. People, housemates and children are still
+        taken in the same order as in allocateCare, so the result is
+        the same.
+        """
+        pop = self.pop
+        living = census.living
+        need = census.need
+        supply = census.supply
+        house = pop.house[living]
+
+        ## Households as segments: the members of house h are
+        ## members[offsets[h]:offsets[h+1]], in occupant order
+        numHouses = len(self.map.allHouses)
+        members = np.lexsort((pop.houseStamp[living], house))
+        offsets = np.zeros(numHouses + 1, dtype=int)
+        offsets[1:] = np.cumsum(np.bincount(house, minlength=numHouses))
+        householdSupply = np.bincount(house, weights=supply, minlength=numHouses)
+
+        ## Where each living person sits in the arrays above
+        position = np.full(pop.size, -1, dtype=int)
+        position[living] = np.arange(len(living))
+        town = self.map.houseTown[house]
+
+        careRequired = need.tolist()
+        careAvailable = supply.tolist()
+        householdSupply = householdSupply.tolist()
+        house = house.tolist()
+        town = town.tolist()
+
+        donorsTried = 0
+        for k in np.flatnonzero(need > 0.000001).tolist():
+            ## Can you get the care you need from your housemates?
+            h = house[k]
+            if householdSupply[h] - careAvailable[k] > 0.0000005:
+                for d in members[offsets[h]:offsets[h+1]].tolist():
+                    donorsTried += 1
+                    if ( d != k and careAvailable[d] > 0.000001 ):
+                        if careAvailable[d] > careRequired[k]:
+                            swap = careRequired[k]
+                            careRequired[k] = 0.0
+                            careAvailable[d] -= swap
+                            householdSupply[h] -= swap
+                            break
+                        else:
+                            swap = careAvailable[d]
+                            careAvailable[d] = 0.0
+                            careRequired[k] -= swap
+                            householdSupply[h] -= swap
 
-            peopleCount = 0
-            for h in self.map.occupiedHouses:
-                peopleCount += len(h.occupants)
-            print "True pop counting occupants of all occupied houses = ", peopleCount
+            ## Can you get the care you need from your children if they live in the same town?
+            if careRequired[k] > 0.000001:
+                for child in pop.allPeople[living[k]].children:
+                    donorsTried += 1
+                    d = position[child.index]
+                    if ( d >= 0 and town[k] == town[d] and careAvailable[d] > 0.000001 ):
+                        if careAvailable[d] > careRequired[k]:
+                            swap = careRequired[k]
+                            careRequired[k] = 0.0
+                            careAvailable[d] -= swap
+                            householdSupply[house[d]] -= swap
+                            break
+                        else:
+                            swap = careAvailable[d]
+                            careAvailable[d] = 0.0
+                            careRequired[k] -= swap
+                            householdSupply[house[d]] -= swap
 
-            peopleCount = 0
-            for h in self.map.allHouses:
-                peopleCount += len(h.occupants)
-            print "True pop counting occupants of ALL houses = ", peopleCount
+        self.instruments.count('careDonorsTried', donorsTried)
 
-            tally = [ 0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-            for h in self.map.occupiedHouses:
-                tally[len(h.occupants)] += 1
-            for i in range(len(tally)):
-                if tally[i] > 0:
-                    print i, tally[i]
-            print
+        ## Now tally up the care situation, how much need is unmet, because that's the state's burden
+        unmetNeed = sum(careRequired, 0.0)
 
-            
+        return unmetNeed
 
-        
-        
                 
     def initializeCanvas(self):
         """Put up a TKInter canvas window to animate the simulation."""
@@ -1126,32 +1650,142 @@ class Sim:
 
 
 
+class MarriageMarket:
+    """
+    The women interested in marrying this year, bucketed by birth year
+    and remembering the order in which they were added. A man is
+    matched with the first woman, in that order, who is less than 20
+    years younger and less than 5 years older than him and who does
+    not share his mother; only the birth years inside that window are
+    ever looked at.
+
+    Each birth year keeps the women with no mother (the initial
+    population) apart from the rest. A woman with no mother suits any
+    man who has one and no man who hasn't, so neither kind of man ever
+    has to look past the women who can't be his match, apart from his
+    own sisters.
+    """
+    def __init__ (self):
+        self.buckets = {}
+        self.count = 0
+        self.scanned = 0       ## women looked at, for the instrumentation
+
+    def append(self, woman):
+        if woman.birthdate not in self.buckets:
+            self.buckets[woman.birthdate] = (MarriageQueue(), MarriageQueue())
+        motherless, mothered = self.buckets[woman.birthdate]
+        if woman.mother == None:
+            motherless.append(self.count, woman)
+        else:
+            mothered.append(self.count, woman)
+        self.count += 1
+
+    def takeFirstMatch(self, man):
+        """Remove and return the man's match, or None if nobody suits him."""
+        best = None
+        for birthYear in range(man.birthdate - 4, man.birthdate + 20):
+            queues = self.buckets.get(birthYear)
+            if queues == None:
+                continue
+            if man.mother == None:
+                queues = queues[1:]
+            for queue in queues:
+                i = queue.first(man.mother)
+                self.scanned += queue.looked
+                if i != None and (best == None or queue.entries[i][0] < best[0]):
+                    best = (queue.entries[i][0], queue, i)
+        if best == None:
+            return None
+        order, queue, i = best
+        return queue.take(i)
+
+
+class MarriageQueue:
+    """
+    Women in the order they were added. Taken women are blanked out
+    rather than removed, and the head skips past the blanks at the
+    front, so taking a woman costs nothing however long the queue.
+    """
+    def __init__ (self):
+        self.entries = []
+        self.head = 0
+        self.looked = 0
+
+    def append(self, order, woman):
+        self.entries.append((order, woman))
+
+    def first(self, mother):
+        """The position of the first woman left whose mother isn't the given one, or None."""
+        self.looked = 0
+        for i in xrange(self.head, len(self.entries)):
+            entry = self.entries[i]
+            if entry == None:
+                continue
+            self.looked += 1
+            if entry[1].mother != mother:
+                return i
+        return None
+
+    def take(self, i):
+        woman = self.entries[i][1]
+        self.entries[i] = None
+        while self.head < len(self.entries) and self.entries[self.head] == None:
+            self.head += 1
+        return woman
+
+
+class Census:
+    """The aggregate counts for one year, gathered in one pass over the living."""
+    def __init__ (self):
+        self.careDemand = 0
+        self.careSupply = 0
+
+
 class PopPyramid:
-    """Builds a data object for storing population pyramid data in."""
+    """
+    Builds a data object for storing population pyramid data in.
+    The tallies are only worked out when maleData or femaleData is
+    asked for, so runs without graphics never pay for them.
+    """
     def __init__ (self, ageClasses, careLevels):
-        self.maleData = pylab.zeros((ageClasses,careLevels),dtype=int)
-        self.femaleData = pylab.zeros((ageClasses, careLevels),dtype=int)
-
-    def update(self, year, ageClasses, careLevels, pixelFactor, people):
-        ## zero the two arrays
-        for a in range (ageClasses):
-            for c in range (careLevels):
-                self.maleData[a,c] = 0
-                self.femaleData[a,c] = 0
-        ## tally up who belongs in which category
-        for i in people:
-            ageClass = ( year - i.birthdate ) / 5
-            if ageClass > ageClasses - 1:
-                ageClass = ageClasses - 1
-            careClass = i.careNeedLevel
-            if i.sex == 'male':
-                self.maleData[ageClass,careClass] += 1
-            else:
-                self.femaleData[ageClass,careClass] += 1
-
-        ## normalize the totals into pixels
-        total = len(people)        
-        for a in range (ageClasses):
-            for c in range (careLevels):
-                self.maleData[a,c] = pixelFactor * self.maleData[a,c] / total
-                self.femaleData[a,c] = pixelFactor * self.femaleData[a,c] / total
+        self.ageClasses = ageClasses
+        self.careLevels = careLevels
+        self.columns = None
+        self.pixelFactor = 1
+        self.data = None
+
+    def update(self, columns, pixelFactor):
+        """
+        Note that the population has moved on. columns is a function
+        returning the age, care need level and femaleness of everyone
+        living, called the next time the data are wanted.
+        """
+        self.columns = columns
+        self.pixelFactor = pixelFactor
+        self.data = None
+
+    def tally(self):
+        ## nothing to show before the first year has been run
+        if self.columns is None:
+            self.data = np.zeros((2, self.ageClasses, self.careLevels), dtype=int)
+            return
+        ## one count per sex x age class x care level, then normalized into pixels
+        age, level, female = self.columns()
+        ageClass = np.minimum(age // 5, self.ageClasses - 1)
+        cell = ( female.astype(int) * self.ageClasses + ageClass ) * self.careLevels + level
+        counts = np.bincount(cell, minlength = 2 * self.ageClasses * self.careLevels)
+        counts = counts.reshape(2, self.ageClasses, self.careLevels)
+        total = max(len(age), 1)
+        self.data = self.pixelFactor * counts // total
+
+    @property
+    def maleData(self):
+        if self.data is None:
+            self.tally()
+        return self.data[0]
+
+    @property
+    def femaleData(self):
+        if self.data is None:
+            self.tally()
+        return self.data[1]
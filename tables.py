@@ -0,0 +1,49 @@
+"""
+The demographic tables (fertility and mortality by age and year), read
+once and shared.
+
+Parsing the CSVs with genfromtxt is slow, so the first time a table is
+asked for it is converted to a .npy file in a tablecache directory next
+to the CSV. The cached file's name carries the CSV's size and
+modification time, so editing the CSV leads to a fresh conversion.
+Every later load memory-maps the .npy file read-only, which takes
+milliseconds, and all the processes of a sweep share one copy of the
+data in memory.
+"""
+
+import os
+import numpy as np
+
+
+## Tables already mapped in this process, by CSV path
+loaded = {}
+
+
+def cachePath(csvPath):
+    """Where the converted version of the current contents of a CSV lives."""
+    info = os.stat(csvPath)
+    directory = os.path.join(os.path.dirname(csvPath), 'tablecache')
+    name = '%s-%d-%d.npy' % (os.path.basename(csvPath), info.st_size, int(info.st_mtime))
+    return os.path.join(directory, name)
+
+
+def loadTable(csvPath):
+    """A read-only array of a comma-separated table, from the cache where possible."""
+    path = cachePath(csvPath)
+    if path in loaded:
+        return loaded[path]
+
+    if not os.path.exists(path):
+        table = np.genfromtxt(csvPath, skip_header=0, delimiter=',')
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        ## Save under a name of our own then rename, so that other
+        ## processes converting the same table at once don't trip up
+        temporary = path + '.' + str(os.getpid()) + '.npy'
+        np.save(temporary, table)
+        os.rename(temporary, path)
+
+    ## A plain array view of the map, to keep memmap's overhead off every lookup
+    table = np.load(path, mmap_mode='r').view(np.ndarray)
+    loaded[path] = table
+    return table